@@ -1,9 +1,14 @@
 import configparser
+import logging
+import multiprocessing
 import os
+import tempfile
 import unittest
 from datetime import date
+from unittest.mock import MagicMock, patch
 from dateutil.relativedelta import relativedelta
 
+import numpy as np
 from TM1py import (
     TM1Service,
     Dimension,
@@ -36,6 +41,10 @@ from methods import (
     mean,
     sem,
     median,
+    quantile,
+    approx_count,
+    approx_quantile,
+    percentile,
     mode,
     var,
     rng,
@@ -44,7 +53,40 @@ from methods import (
     var_p,
     kurt,
     generate_dates_from_rows,
+    cumulative_sum,
+    rolling_sum,
+    cumulative_mean,
+    cumulative_var,
+    rolling_stdev,
+    cumulative_npv,
+    rolling_npv,
+    rolling_irr,
+    ipmt,
+    amortization_schedule,
+    parse_grid,
+    npv_grid,
+    mirr_grid,
+    correl,
+    covar,
+    sln_schedule,
+    db_schedule,
+    ddb_schedule,
+    syd_schedule,
+    simulate,
+    pv_grid,
 )
+from utils import compute_batch, CubeCalc, ChunkSizer, aggregation_matrix, replay_snapshot, log_results, \
+    process_pool, read_bound_parameters
+from methods import write_cell_values
+from jobs import JobScheduler, load_manifest
+from cache import read_rows_and_values, normalize_mdx
+from snapshot import Snapshot, SnapshotWriter
+from session import CubeCalcSession
+from telemetry import RunStats, STATS_METRICS
+from checkpoint import Checkpoint, DeadlineReached
+from explain import build_plan
+from sketches import HyperLogLog, KllSketch
+import kernels
 
 config = configparser.ConfigParser()
 config.read(os.path.join(os.path.abspath(os.path.dirname(__file__)), "config.ini"))
@@ -123,6 +165,34 @@ PPMT_INPUT_PV = 1000
 PPMT_EXPECTED_RESULT = -332.32628398791
 PPMT_TOLERANCE = 0.00001
 
+IPMT_EXPECTED_RESULT = -69.78851963746
+IPMT_TOLERANCE = 0.00001
+
+AMORTIZATION_SCHEDULE_LOANS = [
+    [PPMT_INPUT_RATE, PPMT_INPUT_NPER, PPMT_INPUT_PV],
+    [0.05, 5, 2000]]
+AMORTIZATION_SCHEDULE_TOLERANCE = 0.00001
+
+GRID_RANGE = "0.05:0.15:0.0025"
+GRID_RANGE_LENGTH = 41
+GRID_SERIES = [[value, value * 2] for value in NPV_INPUT_VALUES]
+
+CORREL_SERIES = [[1, 2, 3], [2, 4, 1], [3, 7, 2], [4, 8, 0]]
+# the third series is correlated over the first three periods only: -1 / 2 and -6 / sqrt(228)
+CORREL_EXPECTED_RESULT = [[1, 0.98449518, -0.5], [0.98449518, 1, -0.39735971], [-0.5, -0.39735971, 1]]
+COVAR_EXPECTED_RESULT = [[2 / 3, 5 / 3, -1 / 3], [5 / 3, 38 / 9, -2 / 3], [-1 / 3, -2 / 3, 2 / 3]]
+COVAR_MASKED_EXPECTED_RESULT = [[1.25, 2.625, -1 / 3], [2.625, 5.6875, -2 / 3], [-1 / 3, -2 / 3, 2 / 3]]
+CORREL_TOLERANCE = 1e-8
+
+# examples from the Excel documentation of DB, DDB and SYD
+DB_EXPECTED_RESULT = [186083.33, 259639.42, 176814.44, 120410.64, 81999.64, 55841.76, 15845.10]
+DDB_INPUT_COST, DDB_INPUT_SALVAGE, DDB_INPUT_LIFE = 2400, 300, 10
+DDB_EXPECTED_RESULT = [480, 384, 307.2, 245.76, 196.61, 157.29, 125.83, 100.66, 80.53, 22.12]
+SYD_EXPECTED_FIRST, SYD_EXPECTED_LAST = 4090.91, 409.09
+DEPRECIATION_TOLERANCE = 0.01
+
+SIMULATE_INPUT_MATRIX = [[value, abs(value) * 0.1] for value in NPV_INPUT_VALUES]
+
 MIRR_INPUT_VALUES = [-1000, 300, 400, 400, 300]
 MIRR_INPUT_FINANCE_RATE = 0.12
 MIRR_INPUT_REINVEST_RATE = 0.1
@@ -172,6 +242,14 @@ SEM_TOLERANCE = 0.00001
 MEDIAN_VALUES = [1, 2, 3, 4, 5]
 MEDIAN_EXPECTED_RESULT = 3
 
+QUANTILE_VALUES = [7, 1, 5, 3, 9, 2, 8]
+QUANTILE_INPUT = "0.1,0.5,0.9"
+QUANTILE_EXPECTED_RESULT = [1.6, 5, 8.4]
+PERCENTILE_INPUT = "0:100:25"
+PERCENTILE_EXPECTED_RESULT = [1, 2.5, 5, 7.5, 9]
+QUANTILE_TOLERANCE = 1e-9
+APPROX_TOLERANCE = 0.03
+
 MODE_VALUES = [1, 1, 2, 3, 4, 5]
 MODE_EXPECTED_RESULT = 1
 
@@ -196,6 +274,14 @@ STDEV_EXPECTED_RESULT = 2.58198889747161
 STDEV_P_EXPECTED_RESULT = 2.73861278752583
 STDEV_TOLERANCE = 0.00001
 
+SERIES_VALUES = [1, 2, 3, 4, 5]
+SERIES_WINDOW = 3
+CUMULATIVE_SUM_EXPECTED_RESULT = [1, 3, 6, 10, 15]
+ROLLING_SUM_EXPECTED_RESULT = [float("nan"), float("nan"), 6, 9, 12]
+CUMULATIVE_MEAN_EXPECTED_RESULT = [1, 1.5, 2, 2.5, 3]
+ROLLING_STDEV_EXPECTED_RESULT = [float("nan"), float("nan"), 0.81649658, 0.81649658, 0.81649658]
+SERIES_TOLERANCE = 0.00001
+
 
 
 
@@ -287,6 +373,106 @@ class TestMethods(unittest.TestCase):
         result = ppmt(rate=PPMT_INPUT_RATE, per=PPMT_INPUT_PER, nper=PPMT_INPUT_NPER, pv=PPMT_INPUT_PV)
         self.assertAlmostEqual(result, PPMT_EXPECTED_RESULT, delta=PPMT_TOLERANCE)
 
+    def test_ipmt(self):
+        result = ipmt(rate=PPMT_INPUT_RATE, per=PPMT_INPUT_PER, nper=PPMT_INPUT_NPER, pv=PPMT_INPUT_PV)
+        self.assertAlmostEqual(result, IPMT_EXPECTED_RESULT, delta=IPMT_TOLERANCE)
+
+    def test_amortization_schedule(self):
+        result = amortization_schedule(rate=PPMT_INPUT_RATE, nper=PPMT_INPUT_NPER, pv=PPMT_INPUT_PV)
+        payment, interest, principal, balance = result[0][PPMT_INPUT_PER - 1]
+        self.assertAlmostEqual(payment, PMT_EXPECTED_RESULT, delta=AMORTIZATION_SCHEDULE_TOLERANCE)
+        self.assertAlmostEqual(interest, IPMT_EXPECTED_RESULT, delta=AMORTIZATION_SCHEDULE_TOLERANCE)
+        self.assertAlmostEqual(principal, PPMT_EXPECTED_RESULT, delta=AMORTIZATION_SCHEDULE_TOLERANCE)
+        self.assertAlmostEqual(result[0][-1][3], 0, delta=AMORTIZATION_SCHEDULE_TOLERANCE)
+
+    def test_amortization_schedule_many_loans(self):
+        result = amortization_schedule(matrix=AMORTIZATION_SCHEDULE_LOANS)
+        self.assertEqual(result.shape, (2, 5, 4))
+        # first loan ends after 3 periods
+        self.assertEqual(list(result[0][3]), [0, 0, 0, 0])
+        for loan in result:
+            self.assertAlmostEqual(loan[-1][3], 0, delta=AMORTIZATION_SCHEDULE_TOLERANCE)
+
+    def test_parse_grid(self):
+        self.assertEqual(len(parse_grid(GRID_RANGE)), GRID_RANGE_LENGTH)
+        self.assertAlmostEqual(parse_grid(GRID_RANGE)[-1], 0.15)
+        self.assertEqual(list(parse_grid("0.1,0.2")), [0.1, 0.2])
+        self.assertEqual(list(parse_grid(0.1)), [0.1])
+
+    def test_npv_grid(self):
+        result = npv_grid(rate=GRID_RANGE, matrix=GRID_SERIES)
+        self.assertEqual(result.shape, (GRID_RANGE_LENGTH, 2))
+        rate_index = list(parse_grid(GRID_RANGE)).index(0.1)
+        self.assertAlmostEqual(result[rate_index][1], 2 * npv(rate=0.1, values=NPV_INPUT_VALUES), delta=NPV_TOLERANCE)
+
+    def test_pv_grid(self):
+        result = pv_grid(rate="0.05," + str(PV_INPUT_RATE), nper=PV_INPUT_NPER, pmt=PV_INPUT_PMT, fv=PV_INPUT_FV)
+        self.assertEqual(result.shape, (2,))
+        self.assertAlmostEqual(result[1], PV_EXPECTED_RESULT, delta=PV_TOLERANCE)
+
+    def test_mirr_grid(self):
+        result = mirr_grid(
+            values=MIRR_INPUT_VALUES,
+            finance_rate=MIRR_INPUT_FINANCE_RATE,
+            reinvest_rate="0.05," + str(MIRR_INPUT_REINVEST_RATE))
+        self.assertEqual(result.shape, (2, 1))
+        self.assertAlmostEqual(result[1][0], MIRR_EXPECTED_RESULT, delta=MIRR_TOLERANCE)
+
+    def test_correl(self):
+        # the last period of the third series is empty and excluded
+        result = correl(matrix=CORREL_SERIES, ignore_zeros="true")
+        for row, expected_row in zip(result, CORREL_EXPECTED_RESULT):
+            self.assertSeriesAlmostEqual(row, expected_row, delta=CORREL_TOLERANCE)
+
+    def test_covar(self):
+        result = covar(matrix=CORREL_SERIES[:3])
+        for row, expected_row in zip(result, COVAR_EXPECTED_RESULT):
+            self.assertSeriesAlmostEqual(row, expected_row, delta=CORREL_TOLERANCE)
+        # pairs with the third series cover the first three periods only
+        result = covar(matrix=CORREL_SERIES, ignore_zeros="true")
+        for row, expected_row in zip(result, COVAR_MASKED_EXPECTED_RESULT):
+            self.assertSeriesAlmostEqual(row, expected_row, delta=CORREL_TOLERANCE)
+
+    def test_sln_schedule(self):
+        result = sln_schedule(matrix=[[30000, 7500, 10], [1000, 0, 4]])
+        self.assertEqual(result.shape, (2, 10))
+        self.assertSeriesAlmostEqual(result[1], [250] * 4 + [0] * 6, delta=DEPRECIATION_TOLERANCE)
+        self.assertAlmostEqual(result[0].sum(), 22500, delta=DEPRECIATION_TOLERANCE)
+
+    def test_db_schedule(self):
+        result = db_schedule(cost=1000000, salvage=100000, life=6, month=7)
+        self.assertSeriesAlmostEqual(result[0], DB_EXPECTED_RESULT, delta=DEPRECIATION_TOLERANCE)
+
+    def test_ddb_schedule(self):
+        result = ddb_schedule(matrix=[[DDB_INPUT_COST, DDB_INPUT_SALVAGE, DDB_INPUT_LIFE, 2]] * 3)
+        self.assertEqual(result.shape, (3, DDB_INPUT_LIFE))
+        self.assertSeriesAlmostEqual(result[2], DDB_EXPECTED_RESULT, delta=DEPRECIATION_TOLERANCE)
+
+    def test_syd_schedule(self):
+        result = syd_schedule(cost=30000, salvage=7500, life=10)
+        self.assertAlmostEqual(result[0][0], SYD_EXPECTED_FIRST, delta=DEPRECIATION_TOLERANCE)
+        self.assertAlmostEqual(result[0][-1], SYD_EXPECTED_LAST, delta=DEPRECIATION_TOLERANCE)
+
+    def test_simulate(self):
+        # without spread every scenario has the deterministic result
+        certain = [[value, 0] for value in NPV_INPUT_VALUES]
+        result = simulate(matrix=certain, rate=NPV_INPUT_RATE, scenarios=100)
+        self.assertSeriesAlmostEqual(result, [NPV_EXPECTED_RESULT] * 3, delta=NPV_TOLERANCE)
+        result = simulate(matrix=[[value, value] for value in NPV_INPUT_VALUES], measure="IRR", scenarios=100,
+                          distribution="uniform")
+        self.assertSeriesAlmostEqual(result, [irr(NPV_INPUT_VALUES)] * 3, delta=IRR_TOLERANCE)
+        with self.assertRaisesRegex(ValueError, "'rate'"):
+            simulate(matrix=certain, scenarios=100)
+
+        # same seed gives the same quantiles, independent of the block size
+        result = simulate(matrix=SIMULATE_INPUT_MATRIX, rate=NPV_INPUT_RATE, scenarios=5000, seed=7, block_size=1000)
+        self.assertSeriesAlmostEqual(
+            result,
+            simulate(matrix=SIMULATE_INPUT_MATRIX, rate=NPV_INPUT_RATE, scenarios=5000, seed=7, block_size=5000),
+            delta=NPV_TOLERANCE)
+        self.assertLess(result[0], NPV_EXPECTED_RESULT)
+        self.assertGreater(result[2], NPV_EXPECTED_RESULT)
+
     def test_mirr(self):
         result = mirr(
             values=MIRR_INPUT_VALUES,
@@ -301,6 +487,21 @@ class TestMethods(unittest.TestCase):
             dates=XIRR_INPUT_DATES)
         self.assertAlmostEqual(result, XIRR_EXPECTED_RESULT, delta=XIRR_TOLERANCE)
 
+    def test_kernels(self):
+        years = [0, 31 / 365, 428 / 365, 821 / 365, 1217 / 365]
+        self.assertAlmostEqual(
+            kernels.xnpv_loop(XNPV_INPUT_RATE, XNPV_INPUT_VALUES, years),
+            kernels.xnpv_numpy(XNPV_INPUT_RATE, np.array(XNPV_INPUT_VALUES, dtype=float), np.array(years)),
+            delta=1e-9)
+        self.assertAlmostEqual(
+            kernels.xirr_loop(XIRR_INPUT_VALUES, years, 0.1),
+            kernels.xirr_numpy(np.array(XIRR_INPUT_VALUES, dtype=float), np.array(years), 0.1),
+            delta=1e-9)
+        self.assertEqual(kernels.fv_schedule_loop(100.0, FV_SCHEDULE_SCHEDULE), FV_SCHEDULE_EXPECTED_RESULT)
+        timings = kernels.benchmark(periods=100, number=2)
+        self.assertEqual(set(timings), {"fv_schedule", "xnpv", "xirr"})
+        self.assertIn("python loop", timings["xnpv"])
+
     def test_nper(self):
         result = nper(
             rate=NPER_INPUT_RATE,
@@ -342,6 +543,50 @@ class TestMethods(unittest.TestCase):
         result = median(MEDIAN_VALUES)
         self.assertEqual(result, MEDIAN_EXPECTED_RESULT)
 
+    def test_median_even(self):
+        self.assertEqual(median([4, 1, 3, 2]), 2.5)
+
+    def test_quantile(self):
+        result = quantile(QUANTILE_VALUES, QUANTILE_INPUT)
+        self.assertSeriesAlmostEqual(result, QUANTILE_EXPECTED_RESULT, delta=QUANTILE_TOLERANCE)
+
+    def test_percentile(self):
+        result = percentile(QUANTILE_VALUES, PERCENTILE_INPUT)
+        self.assertSeriesAlmostEqual(result, PERCENTILE_EXPECTED_RESULT, delta=QUANTILE_TOLERANCE)
+
+    def test_approx_count(self):
+        values = [float(value % 5000) for value in range(20000)]
+        result = approx_count(values, precision=14)
+        self.assertAlmostEqual(result, len(set(values)), delta=len(set(values)) * APPROX_TOLERANCE)
+
+    def test_approx_quantile(self):
+        values = [float(value) for value in range(100000)]
+        result = approx_quantile(values, QUANTILE_INPUT, k=200)
+        for value, expected_quantile in zip(result, [0.1, 0.5, 0.9]):
+            self.assertAlmostEqual(value / len(values), expected_quantile, delta=APPROX_TOLERANCE)
+        self.assertSeriesAlmostEqual(
+            approx_quantile(QUANTILE_VALUES, "0,0.5,1"), [1, 5, 9], delta=QUANTILE_TOLERANCE)
+
+    def test_approx_stream_and_merge(self):
+        tm1 = MagicMock()
+        tm1.cells.extract_cellset_cells_raw.side_effect = [
+            {"Cells": [{"Value": float(value)} for value in range(start, start + 3)]} for start in (0, 3, 6)] + [
+            {"Cells": [{"Value": 9.0}, {"Value": ""}]}]
+        result = approx_count(tm1_services={"tm1srv01": tm1}, tm1_source="tm1srv01", mdx_source="MDX",
+                              stream_chunk_size=3)
+        self.assertEqual(round(result), 10)
+        self.assertEqual(tm1.cells.extract_cellset_cells_raw.call_count, 4)
+        tm1.cells.delete_cellset.assert_called_once()
+
+        sketches = [HyperLogLog(), HyperLogLog()]
+        quantile_sketches = [KllSketch(), KllSketch(seed=1)]
+        for i, (sketch, quantile_sketch) in enumerate(zip(sketches, quantile_sketches)):
+            sketch.update(range(i * 1000, (i + 2) * 1000))
+            quantile_sketch.update(range(i * 1000, (i + 1) * 1000))
+        self.assertAlmostEqual(sketches[0].merge(sketches[1]).count(), 3000, delta=3000 * APPROX_TOLERANCE)
+        median_value = quantile_sketches[0].merge(quantile_sketches[1]).quantiles([0.5])[0]
+        self.assertAlmostEqual(median_value, 1000, delta=2000 * APPROX_TOLERANCE)
+
     def test_mode(self):
         result = mode(MODE_VALUES)
         self.assertEqual(result, MODE_EXPECTED_RESULT)
@@ -370,6 +615,659 @@ class TestMethods(unittest.TestCase):
         result = count(COUNT_VALUES)
         self.assertEqual(result, COUNT_EXPECTED_RESULT)
 
+    def assertSeriesAlmostEqual(self, series, expected_series, delta):
+        self.assertEqual(len(series), len(expected_series))
+        for value, expected_value in zip(series, expected_series):
+            if expected_value != expected_value:
+                self.assertNotEqual(value, value)
+            else:
+                self.assertAlmostEqual(value, expected_value, delta=delta)
+
+    def test_cumulative_sum(self):
+        result = cumulative_sum(values=SERIES_VALUES)
+        self.assertSeriesAlmostEqual(result, CUMULATIVE_SUM_EXPECTED_RESULT, delta=SERIES_TOLERANCE)
+
+    def test_rolling_sum(self):
+        result = rolling_sum(values=SERIES_VALUES, window=SERIES_WINDOW)
+        self.assertSeriesAlmostEqual(result, ROLLING_SUM_EXPECTED_RESULT, delta=SERIES_TOLERANCE)
+
+    def test_cumulative_mean(self):
+        result = cumulative_mean(values=SERIES_VALUES)
+        self.assertSeriesAlmostEqual(result, CUMULATIVE_MEAN_EXPECTED_RESULT, delta=SERIES_TOLERANCE)
+
+    def test_rolling_stdev(self):
+        result = rolling_stdev(values=SERIES_VALUES, window=SERIES_WINDOW)
+        self.assertSeriesAlmostEqual(result, ROLLING_STDEV_EXPECTED_RESULT, delta=SERIES_TOLERANCE)
+
+    def test_cumulative_empty(self):
+        # empty series give empty results, like cumulative_sum
+        for method in (cumulative_sum, cumulative_mean, cumulative_var):
+            self.assertEqual(len(method(values=[])), 0)
+        self.assertEqual(len(rolling_stdev(values=[], window=SERIES_WINDOW)), 0)
+
+    def test_cumulative_npv(self):
+        result = cumulative_npv(values=NPV_INPUT_VALUES, rate=NPV_INPUT_RATE)
+        self.assertAlmostEqual(result[-1], npv(values=NPV_INPUT_VALUES, rate=NPV_INPUT_RATE), delta=SERIES_TOLERANCE)
+
+    def test_rolling_npv(self):
+        result = rolling_npv(values=NPV_INPUT_VALUES, rate=NPV_INPUT_RATE, window=len(NPV_INPUT_VALUES) - 1)
+        expected_result = npv(values=NPV_INPUT_VALUES[1:], rate=NPV_INPUT_RATE)
+        self.assertAlmostEqual(result[-1], expected_result, delta=SERIES_TOLERANCE)
+
+    def test_rolling_irr(self):
+        result = rolling_irr(values=IRR_INPUT_VALUES, window=len(IRR_INPUT_VALUES))
+        self.assertAlmostEqual(result[-1], IRR_EXPECTED_RESULT, delta=IRR_TOLERANCE)
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_compute_batch_process_pool(self):
+        series = [XIRR_INPUT_VALUES, [value * 2 for value in XIRR_INPUT_VALUES], MIRR_INPUT_VALUES]
+        dates = [XIRR_INPUT_DATES] * len(series)
+        for method in ("IRR", "XIRR", "MIRR"):
+            parameters = {"finance_rate": MIRR_INPUT_FINANCE_RATE, "reinvest_rate": MIRR_INPUT_REINVEST_RATE}
+            expected = compute_batch(method, parameters, series, dates, compute_workers=1)
+            results = compute_batch(method, parameters, series, dates, compute_workers=2)
+            for result, expected_result in zip(results, expected):
+                self.assertAlmostEqual(result, expected_result, delta=XIRR_TOLERANCE)
+        results = compute_batch("XIRR", {}, series, dates, compute_workers=2)
+        self.assertAlmostEqual(results[0], XIRR_EXPECTED_RESULT, delta=XIRR_TOLERANCE)
+
+    def test_compute_batch_arrays(self):
+        series = [np.array(XIRR_INPUT_VALUES, dtype=np.float64)] * 2
+        dates = [np.array([element_date.toordinal() for element_date in XIRR_INPUT_DATES])] * 2
+        for compute_workers in (1, 2):
+            results = compute_batch("XIRR", {}, series, dates, compute_workers=compute_workers)
+            self.assertAlmostEqual(results[1], XIRR_EXPECTED_RESULT, delta=XIRR_TOLERANCE)
+        # methods without dates
+        results = compute_batch("NPV", {"rate": NPV_INPUT_RATE}, [NPV_INPUT_VALUES] * 2, [[]] * 2, compute_workers=2)
+        self.assertEqual(results[0], results[1])
+
+    def test_compute_batch_gaps(self):
+        # empty cells are NaN, whatever the number of workers and the lengths of the series
+        series = [[-100, None, 60, 60], [-50, 10, 50], [None, 5, 7]]
+        for method in ("NPV", "MEDIAN", "STDEV"):
+            expected = compute_batch(method, {"rate": NPV_INPUT_RATE}, series, [[]] * len(series), compute_workers=1)
+            results = compute_batch(method, {"rate": NPV_INPUT_RATE}, series, [[]] * len(series), compute_workers=2)
+            np.testing.assert_array_equal(results, expected)
+            self.assertTrue(np.isnan(expected[2]))
+
+    def test_read_bound_parameters(self):
+        tm1 = MagicMock()
+        tm1.cubes.get_dimension_names.side_effect = lambda cube: {
+            "Py Project Params": ["Py Project", "Py Param"], "Py Global Params": ["Py Param"]}[cube]
+        tm1.cells.execute_mdx_rows_and_values.return_value = {("Project1",): [0.1], ("Project2",): [None]}
+        tm1.cells.get_value.return_value = 0.05
+        element_tuples = [("Project1",), ("Project2",)]
+        parameters = read_bound_parameters(tm1, ["Py Project"], ["Py Project"], element_tuples, {
+            "rate": "Py Project Params:Rate", "finance_rate": "Py Global Params:Finance Rate"})
+        self.assertEqual(parameters["rate"], [0.1, 0])
+        # a cube without title dimension holds one value for all elements
+        self.assertEqual(parameters["finance_rate"], [0.05, 0.05])
+        tm1.cells.get_value.assert_called_once_with("Py Global Params", "Finance Rate")
+        tm1.cells.execute_mdx_rows_and_values.assert_called_once()
+
+    def test_compute_batch_element_parameters(self):
+        rates = [FV_INPUT_RATE, 0.05, 0.2]
+        parameters = {"nper": FV_INPUT_NPER, "pmt": FV_INPUT_PMT, "pv": FV_INPUT_PV}
+        results = compute_batch("FV", parameters, [[]] * len(rates), [[]] * len(rates),
+                                element_parameters={"rate": rates})
+        for result, element_rate in zip(results, rates):
+            self.assertAlmostEqual(result, fv(rate=element_rate, **parameters), delta=FV_TOLERANCE)
+        self.assertAlmostEqual(results[0], FV_EXPECTED_RESULT, delta=FV_TOLERANCE)
+
+    def test_compute_batch_row_wise(self):
+        series = [QUANTILE_VALUES, [value * 2 for value in QUANTILE_VALUES], list(reversed(QUANTILE_VALUES))]
+        results = compute_batch("QUANTILE", {"quantiles": QUANTILE_INPUT}, series, [[]] * len(series))
+        for result, element_values in zip(results, series):
+            self.assertEqual(result, quantile(element_values, QUANTILE_INPUT).tolist())
+        self.assertEqual(compute_batch("MEDIAN", {}, series, [[]] * len(series)), [5, 10, 5])
+
+    def test_substitute_view_titles(self):
+        view = NativeView(
+            cube_name=CUBE_NAME_SOURCE,
+            view_name=VIEW_NAME_SOURCE)
+        view.add_column(
+            dimension_name=DIMENSION_NAMES[1],
+            subset=AnonymousSubset(DIMENSION_NAMES[1], elements=["Element_1"]))
+        for dimension_name, element in zip(("Project", "Version"), ("Project1", "Actual")):
+            view.add_title(
+                dimension_name=dimension_name,
+                selection=element,
+                subset=AnonymousSubset(dimension_name, elements=[element]))
+        # CubeCalc without connections
+        calculator = CubeCalc.__new__(CubeCalc)
+        mdx = calculator.substitute_view_titles(
+            view, [("Project", "Project"), ("Version", "Version")], ("Project2", "Plan"))
+        self.assertIn("[project].[project].[project2]", mdx)
+        self.assertIn("[version].[version].[plan]", mdx)
+
+    def test_write_cell_values_diff(self):
+        tm1 = MagicMock()
+        tm1.cells.execute_mdx.return_value = {
+            ("Project1", "2020"): 100.0, ("Project1", "2021"): None, ("Project1", "2022"): 50.0}
+        suppressed = write_cell_values(tm1, CUBE_NAME_TARGET, "MDX", [100.00001, 0, 60.0], tolerance=0.001)
+        self.assertEqual(suppressed, 2)
+        tm1.cells.write_values.assert_called_once_with(CUBE_NAME_TARGET, {("Project1", "2022"): 60.0})
+
+        tm1 = MagicMock()
+        self.assertEqual(write_cell_values(tm1, CUBE_NAME_TARGET, "MDX", [1.0]), 0)
+        tm1.cells.write_values_through_cellset.assert_called_once_with(mdx="MDX", values=[1.0])
+        tm1.cells.execute_mdx.assert_not_called()
+
+    def test_tm1_io_mdx(self):
+        tm1 = MagicMock()
+        tm1.cells.execute_mdx_rows_and_values.return_value = {
+            (str(2020 + i),): [value] for i, value in enumerate(NPV_INPUT_VALUES)}
+        mdx_source = f"SELECT {{[Measure].[Value]}} ON 0, {{[Period].Members}} ON 1 FROM [{CUBE_NAME_SOURCE}]"
+        result = npv(rate=NPV_INPUT_RATE, tm1_services={"tm1srv01": tm1}, tm1_source="tm1srv01",
+                     tm1_target="tm1srv01", mdx_source=mdx_source, cube_target=CUBE_NAME_TARGET,
+                     target_coordinates="Project1,NPV", tidy="true")
+        self.assertAlmostEqual(result, NPV_EXPECTED_RESULT, delta=NPV_TOLERANCE)
+        tm1.cells.execute_mdx_rows_and_values.assert_called_once_with(mdx=mdx_source, element_unique_names=False)
+        tm1.cells.write_value.assert_called_once_with(result, CUBE_NAME_TARGET, ("Project1", "NPV"))
+        # no views to create or delete
+        tm1.cubes.views.delete.assert_not_called()
+        tm1.cubes.views.get.assert_not_called()
+
+    def test_tm1_io_target_coordinates_diff(self):
+        tm1 = MagicMock()
+        tm1.cells.get_value.return_value = npv(rate=NPV_INPUT_RATE, values=NPV_INPUT_VALUES) + 0.005
+        parameters = dict(rate=NPV_INPUT_RATE, values=NPV_INPUT_VALUES, tm1_services={"tm1srv01": tm1},
+                          tm1_target="tm1srv01", cube_target=CUBE_NAME_TARGET, target_coordinates="Project1,NPV",
+                          write_diff="true", write_tolerance="0.01")
+        npv(**parameters)
+        # TM1py parses the comma separated coordinates
+        tm1.cells.get_value.assert_called_once_with(CUBE_NAME_TARGET, "Project1,NPV")
+        tm1.cells.write_value.assert_not_called()
+
+        tm1.cells.get_value.return_value = 0
+        result = npv(**parameters)
+        tm1.cells.write_value.assert_called_once_with(result, CUBE_NAME_TARGET, ("Project1", "NPV"))
+
+    def test_build_plan(self):
+        projects = [f"Project{i}" for i in range(5)]
+        tm1 = MagicMock()
+        tm1.subsets.get_element_names.return_value = projects
+        tm1.views.get.side_effect = lambda cube, view_name, private: self.native_view(view_name)
+        tm1.cells.execute_mdx_cellcount.return_value = 3
+        tm1.cells.execute_mdx_rows_and_values.return_value = {
+            (period,): [value] for period, value in zip(("2020-12-31", "2021-12-31", "2022-12-31"), (-100, 60, 60))}
+        calculator = CubeCalc.__new__(CubeCalc)
+        calculator.tm1_services = {"tm1srv01": tm1}
+        calculator.actual_names = dict()
+        parameters = {"tm1_source": "tm1srv01", "tm1_target": "tm1srv01", "cube_source": CUBE_NAME_SOURCE,
+                      "cube_target": CUBE_NAME_TARGET, "view_source": VIEW_NAME_SOURCE,
+                      "view_target": VIEW_NAME_TARGET, "dimension": "Project", "subset": "All Projects",
+                      "rate": NPV_INPUT_RATE, "chunk_size": "2"}
+
+        plan = build_plan(calculator, "NPV", parameters)
+        self.assertEqual(plan.mode, "pipeline")
+        self.assertEqual(plan.elements, len(projects))
+        self.assertEqual(plan.calls["read"], 3)
+        self.assertEqual(plan.calls["write"], 3)
+        self.assertEqual(plan.cells_read, 3 * len(projects))
+        self.assertIsNotNone(plan.compute_seconds)
+        # nothing is altered or written
+        tm1.views.update.assert_not_called()
+        tm1.cells.write_values_through_cellset.assert_not_called()
+
+        # the same mode as the run: snapshot_out takes the batch path
+        del parameters["chunk_size"]
+        self.assertEqual(build_plan(calculator, "NPV", {**parameters, "snapshot_out": "snapshot"}).mode, "batch")
+        self.assertEqual(build_plan(calculator, "NPV", {**parameters, "deadline": "3600"}).mode, "iterative")
+        plan = build_plan(calculator, "NPV", {**parameters, "aggregate": "true"})
+        self.assertEqual(plan.mode, "aggregated")
+        self.assertEqual((plan.calls["read"], plan.calls["write"]), (1, 1))
+
+    @staticmethod
+    def native_view(view_name):
+        view = NativeView(cube_name=CUBE_NAME_SOURCE, view_name=view_name)
+        view.add_row(dimension_name="Period", subset=AnonymousSubset("Period", elements=["2020-12-31"]))
+        view.add_column(dimension_name="Measure", subset=AnonymousSubset("Measure", elements=["Value"]))
+        view.add_title(dimension_name="Project", selection="Project0",
+                       subset=AnonymousSubset("Project", elements=["Project0"]))
+        return view
+
+    def test_aggregation_matrix(self):
+        edges = {("Total", "Portfolio A"): 1, ("Total", "Project3"): -1,
+                 ("Portfolio A", "Project1"): 1, ("Portfolio A", "Project2"): 0.5}
+        matrix, leaves = aggregation_matrix(edges, ["Total", "portfolio a", "Project1"])
+        self.assertEqual(leaves, ["Project1", "Project2", "Project3"])
+        self.assertEqual(matrix.toarray().tolist(), [[1, 0.5, -1], [1, 0.5, 0], [1, 0, 0]])
+
+    def test_execute_aggregated_mode(self):
+        hierarchy = Hierarchy("Project", "Project")
+        for project in ("Project1", "Project2"):
+            hierarchy.add_element(project, "Numeric")
+            hierarchy.add_edge("Total", project, 1)
+        hierarchy.add_element("Total", "Consolidated")
+        cashflows = {"Project1": [-100, 60, 60], "Project2": [-50, 10, 50]}
+        periods = ["2020-12-31", "2021-12-31", "2022-12-31"]
+
+        tm1 = MagicMock()
+        tm1.hierarchies.get.return_value = hierarchy
+        tm1.views.get.side_effect = lambda cube, view_name, private: self.native_view(view_name)
+        tm1.cells.execute_mdx_cellcount.return_value = 1
+        tm1.cells.execute_mdx_rows_and_values.return_value = {
+            (project, period): [value]
+            for project, values in cashflows.items()
+            for period, value in zip(periods, values)}
+        calculator = CubeCalc.__new__(CubeCalc)
+        calculator.tm1_services = {"tm1srv01": tm1}
+        calculator.execute_iterative_mode("NPV", {
+            "tm1_source": "tm1srv01", "tm1_target": "tm1srv01", "cube_source": CUBE_NAME_SOURCE,
+            "cube_target": CUBE_NAME_TARGET, "view_source": VIEW_NAME_SOURCE, "view_target": VIEW_NAME_TARGET,
+            "dimension": "Project", "rate": NPV_INPUT_RATE, "aggregate": "true"})
+
+        # one leaf level read and one write for leaves and consolidation
+        tm1.cells.execute_mdx_rows_and_values.assert_called_once()
+        values = tm1.cells.write_values_through_cellset.call_args.kwargs["values"]
+        expected = [npv(rate=NPV_INPUT_RATE, values=cashflows["Project1"]),
+                    npv(rate=NPV_INPUT_RATE, values=cashflows["Project2"]),
+                    npv(rate=NPV_INPUT_RATE, values=[-150, 70, 110])]
+        for value, expected_value in zip(values, expected):
+            self.assertAlmostEqual(value, expected_value, delta=NPV_TOLERANCE)
+
+    def test_execute_aggregated_mode_periods(self):
+        hierarchy = Hierarchy("Project", "Project")
+        for project in ("Project1", "Project2"):
+            hierarchy.add_element(project, "Numeric")
+            hierarchy.add_edge("Total", project, 1)
+        hierarchy.add_element("Total", "Consolidated")
+        # the first leaf has no data in the first period
+        cashflows = {"Project1": {"2021-12-31": -100, "2022-12-31": 60},
+                     "Project2": {"2020-12-31": -50, "2021-12-31": 10, "2022-12-31": 50}}
+
+        tm1 = MagicMock()
+        tm1.hierarchies.get.return_value = hierarchy
+        tm1.views.get.side_effect = lambda cube, view_name, private: self.native_view(view_name)
+        tm1.cells.execute_mdx_cellcount.return_value = 1
+        tm1.cells.execute_mdx_rows_and_values.return_value = {
+            (project, period): [value]
+            for project, values in cashflows.items()
+            for period, value in values.items()}
+        calculator = CubeCalc.__new__(CubeCalc)
+        calculator.tm1_services = {"tm1srv01": tm1}
+        calculator.execute_iterative_mode("NPV", {
+            "tm1_source": "tm1srv01", "tm1_target": "tm1srv01", "cube_source": CUBE_NAME_SOURCE,
+            "cube_target": CUBE_NAME_TARGET, "view_source": VIEW_NAME_SOURCE, "view_target": VIEW_NAME_TARGET,
+            "dimension": "Project", "rate": NPV_INPUT_RATE, "aggregate": "true"})
+
+        # all series are aligned in chronological order
+        values = tm1.cells.write_values_through_cellset.call_args.kwargs["values"]
+        expected = [npv(rate=NPV_INPUT_RATE, values=[0, -100, 60]),
+                    npv(rate=NPV_INPUT_RATE, values=[-50, 10, 50]),
+                    npv(rate=NPV_INPUT_RATE, values=[-50, -90, 110])]
+        for value, expected_value in zip(values, expected):
+            self.assertAlmostEqual(value, expected_value, delta=NPV_TOLERANCE)
+
+    def test_chunk_sizer(self):
+        self.assertEqual(ChunkSizer("250").size, 250)
+        chunk_sizer = ChunkSizer("auto")
+        size = chunk_sizer.size
+        chunk_sizer.observe(size, 0.01, size)
+        self.assertEqual(chunk_sizer.size, 2 * size)
+        chunk_sizer.observe(chunk_sizer.size, 8, chunk_sizer.size)
+        self.assertLess(chunk_sizer.size, size)
+        with self.assertRaises(ValueError):
+            ChunkSizer(0)
+
+    def test_setup_connection_pool_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "config.ini")
+            with open(path, "w") as file:
+                file.write("[tm1srv01]\naddress=localhost\n\n[tm1srv02]\naddress=localhost\nconnection_pool_size=4\n")
+            with patch("utils.TM1Service") as tm1_service:
+                CubeCalc(config=path)
+        pool_sizes = [call.kwargs["connection_pool_size"] for call in tm1_service.call_args_list]
+        self.assertEqual(pool_sizes, ["32", "4"])
+
+    def test_process_pool_logging(self):
+        log_queue = multiprocessing.Queue()
+        with patch("utils._log_queue", log_queue):
+            with process_pool(1) as pool:
+                pool.submit(logging.warning, "logged in worker").result()
+        # the record of the worker reaches the queue of the listener
+        self.assertEqual(log_queue.get(timeout=10).getMessage(), "logged in worker")
+
+    def test_log_results(self):
+        element_tuples = [("Project1",), ("Project2",)]
+        with self.assertLogs(level="INFO") as logs:
+            log_results("NPV", element_tuples, [1.0, 2.0])
+            logging.info("summary")
+        self.assertEqual(logs.output, ["INFO:root:summary"])
+        with self.assertLogs(level="DEBUG") as logs:
+            log_results("NPV", element_tuples, [1.0, 2.0])
+        self.assertEqual(logs.output, [
+            "DEBUG:root:Successfully calculated NPV with result: 1.0 for title element 'Project1'",
+            "DEBUG:root:Successfully calculated NPV with result: 2.0 for title element 'Project2'"])
+
+    def test_execute_pipeline(self):
+        projects = [f"Project{i}" for i in range(7)]
+        periods = ["2020-12-31", "2021-12-31", "2022-12-31"]
+        views = []
+        for view_name in (VIEW_NAME_SOURCE, VIEW_NAME_TARGET):
+            view = NativeView(cube_name=CUBE_NAME_SOURCE, view_name=view_name)
+            view.add_row(dimension_name="Period", subset=AnonymousSubset("Period", elements=periods))
+            view.add_column(dimension_name="Measure", subset=AnonymousSubset("Measure", elements=["Value"]))
+            view.add_title(dimension_name="Project", selection="Project0",
+                           subset=AnonymousSubset("Project", elements=["Project0"]))
+            views.append(view)
+
+        def execute_mdx_rows_and_values(mdx, **kwargs):
+            return {(project, period): [(projects.index(project) + 1) * (-100 if period == periods[0] else 60)]
+                    for project
+                    in projects
+                    if f"[project].[project].[{project.lower()}]" in mdx
+                    for period
+                    in periods}
+
+        tm1_source, tm1_target = MagicMock(), MagicMock()
+        tm1_source.cells.execute_mdx_rows_and_values.side_effect = execute_mdx_rows_and_values
+        tm1_target.cells.execute_mdx_cellcount.return_value = 1
+        calculator = CubeCalc.__new__(CubeCalc)
+        calculator.execute_pipeline("NPV", {"rate": NPV_INPUT_RATE}, tm1_source, tm1_target, views[0], views[1],
+                                    [("Project", "Project")], [("Project", "Project")],
+                                    [(project,) for project in projects], {}, 1, ChunkSizer(3))
+
+        # 3 chunks: one read and one write per chunk
+        self.assertEqual(tm1_source.cells.execute_mdx_rows_and_values.call_count, 3)
+        writes = tm1_target.cells.write_values_through_cellset.call_args_list
+        self.assertEqual([len(call.kwargs["values"]) for call in writes], [3, 3, 1])
+        values = [value for call in writes for value in call.kwargs["values"]]
+        for i, value in enumerate(values):
+            self.assertAlmostEqual(value, npv(rate=NPV_INPUT_RATE, values=[-100 * (i + 1), 60 * (i + 1), 60 * (i + 1)]),
+                                   delta=NPV_TOLERANCE)
+
+
+class TestCache(unittest.TestCase):
+
+    def test_read_rows_and_values(self):
+        rows_and_values = {("2020-12-31", "Value"): [-100.0, None], ("2021-12-31", "Value"): [60.0, 1.5]}
+        tm1 = MagicMock()
+        tm1.cells.execute_mdx_rows_and_values.return_value = rows_and_values
+        tm1.cubes.get_last_data_update.return_value = "2024-01-01T10:00:00Z"
+        mdx = "SELECT {[Measure].[Value]} ON 0 FROM [" + CUBE_NAME_SOURCE + "]"
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            read_rows_and_values(tm1, "tm1srv01", CUBE_NAME_SOURCE, mdx, cache_dir)
+            # same query with different formatting is served from the cache
+            result = read_rows_and_values(tm1, "tm1srv01", CUBE_NAME_SOURCE, mdx.replace(" ", "\n  "), cache_dir)
+            self.assertEqual(tm1.cells.execute_mdx_rows_and_values.call_count, 1)
+            self.assertEqual(dict(result), rows_and_values)
+
+            tm1.cubes.get_last_data_update.return_value = "2024-01-01T10:05:00Z"
+            read_rows_and_values(tm1, "tm1srv01", CUBE_NAME_SOURCE, mdx, cache_dir)
+            self.assertEqual(tm1.cells.execute_mdx_rows_and_values.call_count, 2)
+
+    def test_normalize_mdx(self):
+        self.assertEqual(normalize_mdx("SELECT  {[A]}\n ON 0 FROM [C]"), "select {[a]} on 0 from [c]")
+        # string literals are case and whitespace sensitive
+        self.assertNotEqual(normalize_mdx("StrToMember('[P].[A  b]')"), normalize_mdx("StrToMember('[P].[a b]')"))
+
+    def test_read_rows_and_values_failed_write(self):
+        tm1 = MagicMock()
+        tm1.cells.execute_mdx_rows_and_values.return_value = {("2020-12-31", "Value"): [1.0]}
+        tm1.cubes.get_last_data_update.return_value = "2024-01-01T10:00:00Z"
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with patch("cache.np.savez", side_effect=OSError("disk full")):
+                self.assertRaises(OSError, read_rows_and_values, tm1, "tm1srv01", CUBE_NAME_SOURCE, "SELECT", cache_dir)
+            self.assertEqual(os.listdir(cache_dir), [])
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_snapshot(self):
+        dates = [date(2020, 12, 31), date(2021, 12, 31), date(2022, 12, 31)]
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = SnapshotWriter(directory, "NPV", {"tm1_source": "tm1srv01"}, ["Project"], ["Project"],
+                                      [("Project1",), ("Project2",)], {"rate": [0.1, NPV_INPUT_RATE]})
+            snapshot.append([[-100, 60, 60]], [dates])
+            snapshot.append([[-200, None]], [dates[:2]])
+            # the manifest is written last
+            self.assertRaises(ValueError, Snapshot, directory)
+            snapshot.close()
+
+            loaded = Snapshot(directory)
+            self.assertEqual(loaded.method, "NPV")
+            self.assertEqual(loaded.element_tuples, [("Project1",), ("Project2",)])
+            self.assertIsInstance(loaded.values, np.memmap)
+            self.assertEqual([len(values) for values in loaded.series()], [3, 2])
+            ordinals = [element_date.toordinal() for element_date in dates]
+            self.assertEqual([element_dates.tolist() for element_dates in loaded.dates()], [ordinals, ordinals[:2]])
+            self.assertIsInstance(loaded.dates()[0], np.memmap)
+            self.assertEqual(list(loaded.element_parameters["rate"]), [0.1, NPV_INPUT_RATE])
+            del loaded
+
+            with self.assertLogs(level="DEBUG") as logs:
+                self.assertTrue(replay_snapshot(directory, {}))
+            self.assertIn("for title element 'Project1'", logs.output[0])
+            self.assertIn("2 elements (5 cells)", logs.output[-1])
+            # the workers get the values and dates through shared memory
+            with self.assertLogs(level="INFO") as logs:
+                self.assertTrue(replay_snapshot(directory, {"compute_workers": "2"}))
+            self.assertIn("2 elements (5 cells)", logs.output[-1])
+
+            # parameters parsed from a jobs file, e.g. dates
+            snapshot = SnapshotWriter(os.path.join(directory, "dated"), "NPV", {"valuation_date": dates[0]},
+                                      ["Project"], ["Project"], [])
+            snapshot.close()
+            self.assertEqual(Snapshot(os.path.join(directory, "dated")).parameters, {"valuation_date": "2020-12-31"})
+
+
+class TestSession(unittest.TestCase):
+
+    def test_session(self):
+        tm1 = MagicMock()
+        with CubeCalcSession(tm1_services={"tm1srv01": tm1}) as session:
+            self.assertAlmostEqual(session.run("NPV", rate=NPV_INPUT_RATE, values=NPV_INPUT_VALUES),
+                                   NPV_EXPECTED_RESULT, delta=NPV_TOLERANCE)
+            results = session.run_batch("NPV", series=[NPV_INPUT_VALUES, NPV_INPUT_VALUES], rate=NPV_INPUT_RATE)
+            self.assertEqual(results.shape, (2,))
+            self.assertAlmostEqual(results[1], NPV_EXPECTED_RESULT, delta=NPV_TOLERANCE)
+            self.assertRaises(ValueError, session.run_batch, "NPV", rate=NPV_INPUT_RATE)
+            # single mode has nothing to snapshot
+            self.assertRaises(ValueError, session.run, "NPV", rate=NPV_INPUT_RATE, values=NPV_INPUT_VALUES,
+                              snapshot_out="snapshot")
+        # connections passed to the session are not closed
+        tm1.logout.assert_not_called()
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_run_stats(self):
+        tm1 = MagicMock()
+        request_method = tm1.connection.POST
+        request_method.return_value = MagicMock(request=MagicMock(body='{"ä"}'), content=b"[1, 2, 3]")
+        # asynchronous requests return an id
+        tm1.connection.GET.return_value = "async id"
+        stats = RunStats({"tm1srv01": tm1})
+        tm1.connection.POST("/Cubes")
+        tm1.connection.GET("/Cubes")
+        with stats.phase("read"):
+            pass
+        stats.stop(elements=4, success=True)
+        self.assertIs(tm1.connection.POST, request_method)
+
+        metrics = stats.metrics()
+        self.assertEqual(tuple(metrics), STATS_METRICS)
+        self.assertEqual(metrics["REST Calls"], 1)
+        # bytes, not characters
+        self.assertEqual(metrics["Payload Bytes Sent"], 6)
+        self.assertEqual(metrics["Payload Bytes Received"], 9)
+        self.assertEqual(metrics["Elements"], 4)
+        self.assertEqual(metrics["Failures"], 0)
+
+    def test_run_writes_stats(self):
+        tm1 = MagicMock()
+        calculator = CubeCalc(tm1_services={"tm1srv01": tm1})
+        self.assertTrue(calculator.run("NPV", {
+            "rate": NPV_INPUT_RATE, "values": NPV_INPUT_VALUES, "stats_cube": "}CubeCalc Stats",
+            "tm1_stats": "tm1srv01", "stats_elements": "2024-06-01|NPV"}))
+
+        tm1.cells.write_values.assert_called_once()
+        cube, cells = tm1.cells.write_values.call_args.args
+        self.assertEqual(cube, "}CubeCalc Stats")
+        self.assertEqual(cells[("2024-06-01", "NPV", "Elements")], 1)
+        self.assertEqual(cells[("2024-06-01", "NPV", "Success")], 1)
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_checkpoint(self):
+        parameters = {"tm1_source": "tm1srv01", "dimension": "Py Project", "rate": "0.1", "compute_workers": "4"}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.checkpoint.json")
+            checkpoint = Checkpoint("NPV", parameters, deadline="3600", path=path)
+            self.assertFalse(checkpoint.expired())
+            checkpoint.add([("Project1",), ("Project2",)], [1.5, [1.0, 2.0]])
+            checkpoint.save()
+
+            # execution parameters do not change the run
+            resumed = Checkpoint("npv", {**parameters, "compute_workers": "8"}, path=path, resume=True)
+            self.assertEqual(resumed.completed, {("Project1",): 1.5, ("Project2",): [1.0, 2.0]})
+            self.assertEqual(resumed.pending([("Project1",), ("Project3",)]), [("Project3",)])
+            self.assertRaises(ValueError, Checkpoint, "NPV", {**parameters, "rate": "0.2"}, path=path, resume=True)
+            self.assertTrue(Checkpoint("NPV", parameters, deadline="-1", path=path).expired())
+
+            resumed.remove()
+            self.assertFalse(os.path.isfile(path))
+
+    def test_pipeline_deadline(self):
+        projects = [f"Project{i}" for i in range(7)]
+        view = NativeView(cube_name=CUBE_NAME_TARGET, view_name=VIEW_NAME_TARGET)
+        view.add_column(dimension_name="Measure", subset=AnonymousSubset("Measure", elements=["Value"]))
+        view.add_title(dimension_name="Project", selection="Project0",
+                       subset=AnonymousSubset("Project", elements=["Project0"]))
+        tm1_target = MagicMock()
+        tm1_target.cells.execute_mdx_cellcount.return_value = 1
+        calculator = CubeCalc.__new__(CubeCalc)
+        element_tuples = [(project,) for project in projects]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.checkpoint.json")
+            checkpoint = Checkpoint("FV", {}, deadline="3600", path=path)
+            # the deadline is near after the first chunk
+            checkpoint.expired = MagicMock(side_effect=[False, True])
+            with self.assertRaises(DeadlineReached):
+                calculator.execute_pipeline(
+                    "FV", {"rate": FV_INPUT_RATE, "nper": FV_INPUT_NPER, "pmt": FV_INPUT_PMT, "pv": FV_INPUT_PV},
+                    MagicMock(), tm1_target, None, view, [], [("Project", "Project")], element_tuples, {}, 1,
+                    ChunkSizer(3), checkpoint=checkpoint)
+            self.assertEqual(tm1_target.cells.write_values_through_cellset.call_count, 1)
+
+            resumed = Checkpoint("FV", {}, path=path, resume=True)
+            self.assertEqual(list(resumed.completed), element_tuples[:3])
+            self.assertEqual(resumed.pending(element_tuples), element_tuples[3:])
+
+    def iterative_parameters(self, directory):
+        return {"tm1_source": "tm1srv01", "tm1_target": "tm1srv01", "cube_source": CUBE_NAME_SOURCE,
+                "view_source": VIEW_NAME_SOURCE, "cube_target": CUBE_NAME_TARGET, "view_target": VIEW_NAME_TARGET,
+                "dimension": "Project", "subset": "All Projects", "rate": NPV_INPUT_RATE, "values": NPV_INPUT_VALUES,
+                "tidy": "true", "checkpoint": os.path.join(directory, "run.checkpoint.json")}
+
+    def test_iterative_mode_resume_tidy(self):
+        tm1 = MagicMock()
+        tm1.subsets.get_element_names.return_value = ["Project1", "Project2"]
+        calculator = CubeCalc.__new__(CubeCalc)
+        calculator.tm1_services = {"tm1srv01": tm1}
+        with tempfile.TemporaryDirectory() as directory:
+            parameters = self.iterative_parameters(directory)
+            # the last element is completed
+            checkpoint = Checkpoint("NPV", parameters, path=parameters["checkpoint"])
+            checkpoint.add([("Project2",)], [1.0])
+            checkpoint.save()
+            with patch.object(CubeCalc, "alter_view") as alter_view:
+                results = calculator.execute_iterative_mode("NPV", {**parameters, "resume": "true"})
+            alter_view.assert_called_once()
+            self.assertEqual(results[("Project2",)], 1.0)
+        self.assertEqual(tm1.views.delete.call_count, 2)
+        tm1.views.update_or_create.assert_not_called()
+
+    def test_iterative_mode_deadline_tidy(self):
+        tm1 = MagicMock()
+        tm1.subsets.get_element_names.return_value = ["Project1", "Project2"]
+        calculator = CubeCalc.__new__(CubeCalc)
+        calculator.tm1_services = {"tm1srv01": tm1}
+        with tempfile.TemporaryDirectory() as directory:
+            with patch.object(CubeCalc, "alter_view") as alter_view:
+                with self.assertRaises(DeadlineReached):
+                    calculator.execute_iterative_mode("NPV", {**self.iterative_parameters(directory),
+                                                              "deadline": "-1"})
+            alter_view.assert_not_called()
+        self.assertEqual(tm1.views.delete.call_count, 2)
+
+    def test_batch_mode_deadline(self):
+        tm1 = MagicMock()
+        calculator = CubeCalc.__new__(CubeCalc)
+        calculator.tm1_services = {"tm1srv01": tm1}
+        parameters = {"tm1_source": "tm1srv01", "tm1_target": "tm1srv01", "cube_target": CUBE_NAME_TARGET,
+                      "view_target": VIEW_NAME_TARGET}
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_out = os.path.join(directory, "snapshot")
+            checkpoint = Checkpoint("FV", {}, deadline="3600", path=os.path.join(directory, "run.checkpoint.json"))
+            with patch.object(CubeCalc, "resolve_title"), \
+                    patch.object(CubeCalc, "execute_pipeline", side_effect=DeadlineReached("stopped")):
+                with self.assertRaises(DeadlineReached):
+                    calculator.execute_batch_mode("FV", {**parameters, "snapshot_out": snapshot_out}, ["Project"],
+                                                  ["Project"], [("Project1",), ("Project2",)], "true", 1,
+                                                  checkpoint=checkpoint)
+            # the snapshot is closed and the views are tidied up
+            self.assertEqual(Snapshot(snapshot_out).element_tuples, [])
+            tm1.views.delete.assert_called_once()
+
+    def test_deadline_unsupported_modes(self):
+        calculator = CubeCalc.__new__(CubeCalc)
+        calculator.tm1_services = {"tm1srv01": MagicMock()}
+        with self.assertRaises(ValueError):
+            calculator.execute_iterative_mode("NPV", {"tm1_source": "tm1srv01", "dimension": "Project",
+                                                      "aggregate": "true", "deadline": "3600"})
+        with self.assertLogs(level="ERROR"):
+            self.assertFalse(calculator.run("NPV", {"rate": NPV_INPUT_RATE, "values": NPV_INPUT_VALUES,
+                                                    "resume": "true"}))
+
+
+class TestJobs(unittest.TestCase):
+    MANIFEST = """
+jobs:
+  - {name: npv, method: NPV, tm1_source: tm1srv01}
+  - {name: irr, method: IRR, tm1_source: tm1srv01, depends_on: [npv]}
+  - {name: fail, method: FAIL, tm1_source: tm1srv01}
+  - {name: after_fail, method: IRR, tm1_source: tm1srv01, depends_on: [fail]}
+concurrency:
+  tm1srv01: 1
+"""
+
+    class Calculator:
+        tm1_services = {"tm1srv01": None}
+
+        def __init__(self):
+            self.methods = []
+
+        def run(self, method, parameters):
+            self.methods.append(method)
+            return method != "FAIL"
+
+    def load(self, manifest):
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as file:
+            file.write(manifest)
+        self.addCleanup(os.remove, file.name)
+        return load_manifest(file.name)
+
+    def test_job_scheduler(self):
+        calculator = self.Calculator()
+        scheduler = JobScheduler(calculator, self.load(self.MANIFEST))
+        self.assertFalse(scheduler.run())
+        self.assertLess(calculator.methods.index("NPV"), calculator.methods.index("IRR"))
+        self.assertEqual(scheduler.results["irr"]["status"], "succeeded")
+        self.assertEqual(scheduler.results["fail"]["status"], "failed")
+        self.assertEqual(scheduler.results["after_fail"]["status"], "skipped")
+
+    def test_load_manifest_unknown_dependency(self):
+        with self.assertRaises(ValueError):
+            self.load("jobs:\n  - {name: irr, method: IRR, depends_on: [npv]}\n")
+
 
 class TestDecorators(unittest.TestCase):
     tm1 = TM1Service(**config["tm1srv01"])
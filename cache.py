@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+
+import numpy as np
+from TM1py.Utils import CaseAndSpaceInsensitiveTuplesDict
+
+# hits and misses of all cached reads of the process
+statistics = Counter()
+_statistics_lock = threading.Lock()
+
+
+def normalize_mdx(mdx: str) -> str:
+    """ MDX is not case sensitive and ignores whitespace between tokens. Quoted string literals are kept as they are """
+    parts = re.split(r"(\"(?:[^\"]|\"\")*\"|'(?:[^']|'')*')", mdx)
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part).lower() for i, part in enumerate(parts)).strip()
+
+
+def cache_file(cache_dir, instance: str, cube: str, mdx: str) -> str:
+    key = "|".join((instance.lower(), cube.lower(), normalize_mdx(mdx)))
+    return os.path.join(cache_dir, hashlib.sha256(key.encode("UTF-8")).hexdigest() + ".npz")
+
+
+def read_rows_and_values(tm1, instance: str, cube: str, mdx: str, cache_dir=None):
+    """ execute_mdx_rows_and_values with an optional on-disk cache.
+
+    An entry is valid as long as the LastDataUpdate timestamp of the cube is unchanged. Rows are stored as a
+    string array, values as a float array (empty cells as NaN). Cellsets with string values are not cached.
+
+    :param tm1: TM1Service
+    :param instance: name of the instance in config.ini
+    :param cube: cube of the MDX
+    :param mdx: MDX query
+    :param cache_dir: directory of the cache. None reads without cache
+    :return: rows and values as returned by TM1py
+    """
+    if not cache_dir:
+        return tm1.cells.execute_mdx_rows_and_values(mdx=mdx, element_unique_names=False)
+
+    path = cache_file(cache_dir, instance, cube, mdx)
+    last_data_update = tm1.cubes.get_last_data_update(cube)
+    if os.path.isfile(path):
+        with np.load(path, allow_pickle=False) as entry:
+            if str(entry["last_data_update"]) == last_data_update:
+                logging.debug(f"Read {len(entry['rows'])} rows of cube '{cube}' from cache")
+                _count("hits")
+                return _from_arrays(entry["rows"], entry["values"])
+
+    _count("misses")
+    rows_and_values = tm1.cells.execute_mdx_rows_and_values(mdx=mdx, element_unique_names=False)
+    arrays = _to_arrays(rows_and_values)
+    if arrays is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first, so concurrent jobs never read a partial entry
+        descriptor, temporary_path = tempfile.mkstemp(suffix=".npz", dir=cache_dir)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                np.savez(file, rows=arrays[0], values=arrays[1], last_data_update=np.array(last_data_update))
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+    return rows_and_values
+
+
+def _count(key: str):
+    with _statistics_lock:
+        statistics[key] += 1
+
+
+def _to_arrays(rows_and_values):
+    """ rows as string array (rows x row dimensions), values as float array (rows x columns). None for strings """
+    rows = list(rows_and_values.keys())
+    values = list(rows_and_values.values())
+    if any(isinstance(value, str) for values_by_row in values for value in values_by_row):
+        return None
+    return (
+        np.array(rows, dtype=str).reshape(len(rows), len(rows[0]) if rows else 0),
+        np.array(
+            [[np.nan if value is None else value for value in values_by_row] for values_by_row in values],
+            dtype=np.float64).reshape(len(values), len(values[0]) if values else 0))
+
+
+def _from_arrays(rows, values):
+    rows_and_values = CaseAndSpaceInsensitiveTuplesDict()
+    for row, values_by_row in zip(rows, values):
+        rows_and_values[tuple(row.tolist())] = [None if np.isnan(value) else float(value) for value in values_by_row]
+    return rows_and_values
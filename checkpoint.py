@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from dateutil import parser
+
+from constants import APP_NAME, CHECKPOINT_DIR, CHECKPOINT_INTERVAL
+
+# parameters that control the execution of a run, but not its results
+EXECUTION_PARAMETERS = ("deadline", "resume", "checkpoint", "tidy", "compute_workers", "chunk_size", "log_level")
+
+
+class DeadlineReached(Exception):
+    """ the run stopped before the deadline. Completed elements are saved in the checkpoint """
+
+
+class Checkpoint:
+    """ Completed elements and their results of an iterative run, saved to a JSON file.
+
+    Runs with a deadline stop before the next element (or chunk) would finish after the deadline. A rerun with
+    resume continues with the elements that are not in the checkpoint. The file is removed when a run completes.
+    """
+
+    def __init__(self, method: str, parameters: Dict, deadline=None, path=None, resume=False):
+        """
+        :param deadline: seconds from now or a point in time, e.g. '2024-06-01 06:00'
+        :param path: checkpoint file. By default a file per method and parameters next to the log file
+        :param resume: continue from an existing checkpoint
+        """
+        self.key = json.dumps(
+            {"method": method.upper(),
+             "parameters": {key: str(value)
+                            for key, value
+                            in sorted(parameters.items())
+                            if key not in EXECUTION_PARAMETERS}},
+            sort_keys=True)
+        self.path = path or os.path.join(
+            CHECKPOINT_DIR,
+            f"{APP_NAME}.{hashlib.sha256(self.key.encode('UTF-8')).hexdigest()[:12]}.checkpoint.json")
+        self.deadline = _parse_deadline(deadline) if deadline is not None else None
+        self.completed: Dict[Tuple[str, ...], object] = dict()
+        self.started = time.time()
+        self.elements = 0
+        self.saved = self.started
+        if resume:
+            self.load()
+
+    @classmethod
+    def from_parameters(cls, method: str, parameters: Dict):
+        """ checkpoint of a run, if deadline, resume or checkpoint are passed. Removes them from the parameters """
+        deadline = parameters.pop("deadline", None)
+        resume = parameters.pop("resume", False) in ("True", "true", "TRUE", "1", 1)
+        path = parameters.pop("checkpoint", None)
+        if deadline is None and not resume and path is None:
+            return None
+        return cls(method, parameters, deadline, path, resume)
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            logging.info(f"No checkpoint '{self.path}' to resume from. Starting with the first element")
+            return
+        with open(self.path, "r") as file:
+            content = json.load(file)
+        if content["key"] != self.key:
+            raise ValueError(f"Checkpoint '{self.path}' belongs to a run with other parameters")
+        self.completed = {tuple(element_tuple): result for element_tuple, result in content["completed"]}
+        logging.info(f"Resuming from checkpoint '{self.path}' with {len(self.completed)} completed elements")
+
+    def pending(self, element_tuples: List[Tuple[str, ...]]) -> List[Tuple[str, ...]]:
+        return [element_tuple for element_tuple in element_tuples if element_tuple not in self.completed]
+
+    def expired(self, elements: int = 1) -> bool:
+        """ True if the next elements would not finish before the deadline at the throughput of this run """
+        if self.deadline is None:
+            return False
+        now = time.time()
+        seconds_per_element = (now - self.started) / self.elements if self.elements else 0.0
+        return now + elements * seconds_per_element >= self.deadline
+
+    def add(self, element_tuples: List[Tuple[str, ...]], results: List):
+        """ mark written elements as completed """
+        for element_tuple, result in zip(element_tuples, results):
+            self.completed[tuple(element_tuple)] = result
+        self.elements += len(element_tuples)
+        if time.time() - self.saved >= CHECKPOINT_INTERVAL:
+            self.save()
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # write to a temporary file first, so a killed run never leaves a partial checkpoint
+        descriptor, temporary_path = tempfile.mkstemp(suffix=".json", dir=directory)
+        with os.fdopen(descriptor, "w") as file:
+            json.dump({
+                "key": self.key,
+                "completed": [[list(element_tuple), _serializable(result)]
+                              for element_tuple, result
+                              in self.completed.items()]},
+                file)
+        os.replace(temporary_path, self.path)
+        self.saved = time.time()
+
+    def remove(self):
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+def _parse_deadline(deadline) -> float:
+    """ deadline as timestamp. Numbers are seconds from now """
+    try:
+        return time.time() + float(deadline)
+    except ValueError:
+        return parser.parse(deadline).timestamp()
+
+
+def _serializable(result):
+    if isinstance(result, (np.ndarray, list, tuple)):
+        return np.asarray(result).tolist()
+    if isinstance(result, np.generic):
+        return result.item()
+    return result
@@ -1,7 +1,7 @@
 import sys
 import os
 from pathlib import Path
-from TM1py.Utils import CaseAndSpaceInsensitiveDict
+from TM1py.Utils import CaseAndSpaceInsensitiveDict, CaseAndSpaceInsensitiveSet
 import methods
 
 METHODS = CaseAndSpaceInsensitiveDict({
@@ -15,6 +15,8 @@ METHODS = CaseAndSpaceInsensitiveDict({
     "XNPV": methods.xnpv,
     "PMT": methods.pmt,
     "PPMT": methods.ppmt,
+    "IPMT": methods.ipmt,
+    "AMORTIZATION_SCHEDULE": methods.amortization_schedule,
     "MIRR": methods.mirr,
     "XIRR": methods.xirr,
     "NPER": methods.nper,
@@ -25,6 +27,8 @@ METHODS = CaseAndSpaceInsensitiveDict({
     "MEAN": methods.mean,
     "SEM": methods.sem,
     "MEDIAN": methods.median,
+    "QUANTILE": methods.quantile,
+    "PERCENTILE": methods.percentile,
     "MODE": methods.mode,
     "VAR": methods.var,
     "KURT": methods.kurt,
@@ -33,16 +37,72 @@ METHODS = CaseAndSpaceInsensitiveDict({
     "MIN": methods.min_,
     "MAX": methods.max_,
     "SUM": methods.sum_,
-    "COUNT": methods.count
+    "COUNT": methods.count,
+    "APPROX_COUNT": methods.approx_count,
+    "APPROX_QUANTILE": methods.approx_quantile,
+    "APPROX_MEDIAN": methods.approx_median,
+    "CUMULATIVE_SUM": methods.cumulative_sum,
+    "ROLLING_SUM": methods.rolling_sum,
+    "CUMULATIVE_MEAN": methods.cumulative_mean,
+    "ROLLING_MEAN": methods.rolling_mean,
+    "CUMULATIVE_STDEV": methods.cumulative_stdev,
+    "ROLLING_STDEV": methods.rolling_stdev,
+    "CUMULATIVE_VAR": methods.cumulative_var,
+    "ROLLING_VAR": methods.rolling_var,
+    "CUMULATIVE_NPV": methods.cumulative_npv,
+    "ROLLING_NPV": methods.rolling_npv,
+    "CUMULATIVE_IRR": methods.cumulative_irr,
+    "ROLLING_IRR": methods.rolling_irr,
+    "NPV_GRID": methods.npv_grid,
+    "MIRR_GRID": methods.mirr_grid,
+    "FV_GRID": methods.fv_grid,
+    "PV_GRID": methods.pv_grid,
+    "PMT_GRID": methods.pmt_grid,
+    "CORREL": methods.correl,
+    "COVAR": methods.covar,
+    "SLN_SCHEDULE": methods.sln_schedule,
+    "DB_SCHEDULE": methods.db_schedule,
+    "DDB_SCHEDULE": methods.ddb_schedule,
+    "SYD_SCHEDULE": methods.syd_schedule,
+    "SIMULATE": methods.simulate
+})
+
+# scalar methods that accept arrays with one value per element
+VECTORIZED_METHODS = CaseAndSpaceInsensitiveSet(["FV", "PV", "PMT", "NPER", "RATE", "EFFECT", "NOMINAL", "SLN"])
+# series methods with a kernel that calculates all series of a batch at once (one row per series)
+ROW_WISE_METHODS = CaseAndSpaceInsensitiveDict({
+    "MEDIAN": methods.median_rows,
+    "QUANTILE": methods.quantile_rows,
+    "PERCENTILE": methods.percentile_rows
 })
 
 APP_NAME = "CubeCalc"
+# separates the title dimensions, hierarchies and subsets in multi dimensional iterative mode
+DIMENSION_SEPARATOR = "|"
+# suffix of arguments that bind a parameter to a parameter cube, e.g. --rate_from "Py Project Params:Rate"
+BINDING_SUFFIX = "_from"
+# chunked pipeline mode: --chunk_size auto starts with CHUNK_INITIAL_SIZE elements and adapts the size, so one
+# chunk read takes about CHUNK_TARGET_SECONDS and returns at most CHUNK_MAX_CELLS cells
+CHUNK_INITIAL_SIZE = 100
+CHUNK_TARGET_SECONDS = 2.0
+CHUNK_MAX_CELLS = 500_000
+# chunks that may wait between two pipeline stages
+PIPELINE_QUEUE_SIZE = 2
+# HTTP connections per instance, if not specified in config.ini. The pool must hold a connection for every thread
+# that talks to the instance concurrently (pipeline stages, jobs)
+DEFAULT_CONNECTION_POOL_SIZE = 32
+# parameters of the iterative mode, rejected in single mode instead of being ignored
+ITERATIVE_MODE_PARAMETERS = ("snapshot_out", "deadline", "resume", "checkpoint")
+# checkpoints of runs with --deadline or --resume are saved at most every CHECKPOINT_INTERVAL seconds
+CHECKPOINT_INTERVAL = 5.0
 # Determine current working directory for logging and result_file
 try:
     wd = sys._MEIPASS
     base_path = os.path.dirname(sys.executable)
     LOGFILE = os.path.join(base_path, APP_NAME + ".log")
     CONFIG = os.path.join(base_path, "config.ini")
+    CHECKPOINT_DIR = base_path
 except AttributeError:
     LOGFILE = Path(__file__).parent.joinpath(APP_NAME + ".log")
-    CONFIG = Path(__file__).parent.joinpath("config.ini")
\ No newline at end of file
+    CONFIG = Path(__file__).parent.joinpath("config.ini")
+    CHECKPOINT_DIR = Path(__file__).parent
\ No newline at end of file
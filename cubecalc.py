@@ -1,11 +1,14 @@
 import datetime
 import logging
+import multiprocessing
 import sys
 
 import click
 
 from constants import APP_NAME
-from utils import CubeCalc, exit_cubecalc, configure_logging
+from explain import explain
+from jobs import run_jobs
+from utils import CubeCalc, exit_cubecalc, configure_logging, replay_snapshot
 
 
 @click.command(
@@ -25,10 +28,36 @@ def main(click_arguments):
     dimension,
     subset
 
+    or a job manifest:
+    jobs
+
+    or a snapshot to replay offline:
+    snapshot_in
+
     """
     parameters = {click_arguments.args[arg][2:]: click_arguments.args[arg + 1]
                   for arg
                   in range(0, len(click_arguments.args), 2)}
+    if "log_level" in parameters:
+        # INFO logs summaries, DEBUG the result of every element
+        logging.getLogger().setLevel(parameters.pop("log_level").upper())
+    if "jobs" in parameters:
+        logging.info("{app_name} starts. Jobs: {jobs}.".format(app_name=APP_NAME, jobs=parameters["jobs"]))
+        start = datetime.datetime.now()
+        success = run_jobs(calculator=CubeCalc(), path=parameters["jobs"])
+        exit_cubecalc(success=success, elapsed_time=datetime.datetime.now() - start)
+        return
+
+    if "snapshot_in" in parameters:
+        # offline replay, no connection to TM1
+        directory = parameters.pop("snapshot_in")
+        parameters.pop("method", None)
+        logging.info("{app_name} starts. Snapshot: {snapshot}.".format(app_name=APP_NAME, snapshot=directory))
+        start = datetime.datetime.now()
+        success = replay_snapshot(directory=directory, parameters=parameters)
+        exit_cubecalc(success=success, elapsed_time=datetime.datetime.now() - start)
+        return
+
     method_name = parameters.pop('method')
     logging.info("{app_name} starts. Parameters: {parameters}.".format(
         app_name=APP_NAME,
@@ -37,13 +66,18 @@ def main(click_arguments):
     start = datetime.datetime.now()
     # setup connections
     calculator = CubeCalc()
-    # execute method
-    success = calculator.execute(method=method_name, parameters=parameters)
+    # execute method or only print the execution plan
+    if parameters.pop("explain", False) in ("True", "true", "TRUE", "1", 1):
+        success = explain(calculator=calculator, method=method_name, parameters=parameters)
+    else:
+        success = calculator.execute(method=method_name, parameters=parameters)
     # exit
     exit_cubecalc(success=success, elapsed_time=datetime.datetime.now() - start)
 
 
 if __name__ == "__main__":
+    # process pool workers of the frozen executable must not re-run the CLI
+    multiprocessing.freeze_support()
     try:
         configure_logging()
         main()
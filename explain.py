@@ -0,0 +1,190 @@
+import logging
+import time
+from collections import Counter
+from typing import Dict
+
+from TM1py import Element, NativeView
+
+from constants import DIMENSION_SEPARATOR, BINDING_SUFFIX
+from methods import rows_and_values_to_series, write_tolerance
+from utils import CubeCalc, ChunkSizer, compute_batch, execution_mode
+
+
+class ExecutionPlan:
+    """ Estimated requests, cells and runtime of a run """
+
+    def __init__(self, mode: str, elements: int):
+        self.mode = mode
+        self.elements = elements
+        self.calls = Counter()
+        self.cells_read = 0
+        self.cells_written = 0
+        self.latency = 0.0
+        self.seconds_per_cell = 0.0
+        self.compute_seconds = None
+
+    def estimate(self, compute_workers: int = 1) -> float:
+        """ estimated runtime in seconds. The stages of the pipeline mode overlap """
+        read = (self.calls["read"] + self.calls["metadata"]) * self.latency + self.cells_read * self.seconds_per_cell
+        write = (self.calls["write"] + self.calls["view update"] + self.calls["view delete"]) * self.latency \
+            + self.cells_written * self.seconds_per_cell
+        compute = (self.compute_seconds or 0) * self.elements / max(compute_workers, 1)
+        if self.mode == "pipeline":
+            return max(read, write, compute)
+        return read + write + compute
+
+    def report(self, compute_workers: int = 1) -> str:
+        lines = [f"Mode: {self.mode}", f"Elements: {self.elements}", "HTTP calls:"]
+        lines += [f"  {kind:<14}{count}" for kind, count in sorted(self.calls.items())]
+        lines += [
+            f"  {'total':<14}{sum(self.calls.values())}",
+            f"Cells read: {self.cells_read}",
+            f"Cells written: {self.cells_written}",
+            f"Measured latency: {self.latency * 1000:.1f} ms per call, {self.seconds_per_cell * 1e6:.2f} µs per cell",
+            "Measured compute: " + (f"{self.compute_seconds * 1000:.2f} ms per element"
+                                    if self.compute_seconds is not None
+                                    else "not measured"),
+            f"Estimated runtime: {self.estimate(compute_workers):.1f} s"]
+        return "\n".join(lines)
+
+
+def explain(calculator: CubeCalc, method: str, parameters: Dict) -> bool:
+    """ Print the execution plan of a run without altering views or writing data.
+    Latency and compute time are measured with the first element
+
+    :return: success
+    """
+    try:
+        parameters = dict(parameters)
+        compute_workers = int(parameters.get("compute_workers", 1))
+        plan = build_plan(calculator, method, parameters)
+        logging.info(f"Execution plan for {method}:\n" + plan.report(compute_workers))
+        return True
+    except Exception as ex:
+        logging.exception(f"Failed explaining {method} with parameters {parameters}. Error: {str(ex)}")
+        return False
+    finally:
+        calculator.logout()
+
+
+def build_plan(calculator: CubeCalc, method: str, parameters: Dict) -> ExecutionPlan:
+    tm1_source = calculator.tm1_services[parameters["tm1_source"]]
+    tm1_target = calculator.tm1_services[parameters["tm1_target"]]
+    tidy = parameters.get("tidy", False) in ("True", "true", "TRUE", "1", 1)
+    tolerance = write_tolerance(parameters)
+    bindings = [key for key in parameters if key.endswith(BINDING_SUFFIX)]
+    calls = Counter()
+
+    # elements and titles
+    mode = execution_mode(parameters)
+    if mode == "single":
+        element_tuples, dimensions, hierarchies = [()], [], []
+    elif mode == "aggregated" and "subset" not in parameters:
+        # all numeric and consolidated elements of the hierarchy
+        dimensions = [parameters["dimension"]]
+        hierarchies = [parameters.get("hierarchy", parameters["dimension"])]
+        hierarchy = tm1_source.hierarchies.get(dimensions[0], hierarchies[0])
+        element_tuples = [(element.name,) for element in hierarchy if element.element_type != Element.Types.STRING]
+        calls["metadata"] += 1
+    else:
+        dimensions = parameters["dimension"].split(DIMENSION_SEPARATOR)
+        hierarchies = parameters.get("hierarchy", parameters["dimension"]).split(DIMENSION_SEPARATOR)
+        subsets = parameters.get("subset", DIMENSION_SEPARATOR.join([""] * len(dimensions))).split(
+            DIMENSION_SEPARATOR)
+        view = None
+        if len(dimensions) > 1 and "view_source" in parameters:
+            view = tm1_source.views.get(parameters["cube_source"], parameters["view_source"], private=False)
+        element_tuples = calculator.resolve_element_tuples(tm1_source, view, dimensions, hierarchies, subsets)
+        calls["metadata"] += len(dimensions) if not isinstance(view, NativeView) else 1
+    plan = ExecutionPlan(mode, len(element_tuples))
+    if not element_tuples:
+        plan.calls = calls
+        return plan
+    first = element_tuples[0]
+
+    # source and target MDX of the first element. Titles are substituted on local view objects only
+    view_source, view_target = None, None
+    mdx_source = parameters.get("mdx_source")
+    if mdx_source is None and "view_source" in parameters:
+        view_source = tm1_source.views.get(parameters["cube_source"], parameters["view_source"], private=False)
+        source_titles = [calculator.resolve_title(tm1_source, view_source, dimension, hierarchy)
+                         for dimension, hierarchy
+                         in zip(dimensions, hierarchies)]
+        mdx_source = calculator.substitute_view_titles(view_source, source_titles, first)
+    mdx_target = parameters.get("mdx_target")
+    if mdx_target is None and "view_target" in parameters:
+        view_target = tm1_target.views.get(parameters["cube_target"], parameters["view_target"], private=False)
+        target_titles = [calculator.resolve_title(tm1_target, view_target, dimension, hierarchy)
+                         for dimension, hierarchy
+                         in zip(dimensions, hierarchies)]
+        mdx_target = calculator.substitute_view_titles(view_target, target_titles, first)
+
+    # measure latency with a cell count and the cost per cell with the read of the first element
+    values, dates = [], []
+    source_cells, target_cells = 0, 1 if "target_coordinates" in parameters else 0
+    if mdx_source:
+        started = time.perf_counter()
+        source_cells = tm1_source.cells.execute_mdx_cellcount(mdx_source)
+        plan.latency = time.perf_counter() - started
+        started = time.perf_counter()
+        rows_and_values = tm1_source.cells.execute_mdx_rows_and_values(mdx=mdx_source, element_unique_names=False)
+        plan.seconds_per_cell = max(time.perf_counter() - started - plan.latency, 0) / max(source_cells, 1)
+        values, dates = rows_and_values_to_series(rows_and_values)
+    if mdx_target:
+        started = time.perf_counter()
+        target_cells = tm1_target.cells.execute_mdx_cellcount(mdx_target)
+        if not mdx_source:
+            plan.latency = time.perf_counter() - started
+
+    scalar_parameters = {key: value for key, value in parameters.items() if key not in bindings}
+    try:
+        started = time.perf_counter()
+        compute_batch(method, scalar_parameters, [values], [dates])
+        plan.compute_seconds = time.perf_counter() - started
+    except Exception as ex:
+        # e.g. parameters bound to a parameter cube
+        logging.info(f"Compute time not measured. Error: {str(ex)}")
+
+    n = len(element_tuples)
+    plan.cells_read = source_cells * n
+    plan.cells_written = target_cells * n
+    reads = 1 if mdx_source else 0
+    if mode == "single":
+        calls["read"] += reads
+        calls["metadata"] += 0 if "mdx_target" in parameters or "target_coordinates" in parameters else 1
+        calls["write"] += 1
+    elif mode == "iterative":
+        # alter_view: get and update of source and target view per element, plus backup and restore
+        calls["metadata"] += 2 * n + n + (0 if tidy else 2)
+        calls["view update"] += 2 * n + (0 if tidy else 2)
+        calls["read"] += reads * n
+        calls["write"] += n
+    elif mode == "aggregated":
+        # hierarchy, source and target view, then one read of all leaves and one write of all elements
+        calls["metadata"] += 3
+        calls["read"] += reads
+        calls["write"] += 1
+    else:
+        # one dimension lookup and one read per parameter cube
+        parameter_cubes = {parameters[binding].partition(":")[0] for binding in bindings}
+        calls["metadata"] += 2 + len(parameter_cubes)
+        calls["read"] += len(parameter_cubes)
+        if mode == "batch":
+            calls["read"] += reads * n
+            calls["write"] += 1 if tolerance is not None and calculator.supports_chunk_write(view_target) else n
+        else:
+            chunks = -(-n // ChunkSizer(parameters.get("chunk_size", "auto")).size)
+            calls["metadata"] += 1
+            calls["read"] += reads * (chunks if isinstance(view_source, NativeView) else n)
+            calls["write"] += chunks if calculator.supports_chunk_write(view_target) else n
+    if tolerance is not None:
+        # current target values are read before every write
+        calls["read"] += calls["write"]
+        plan.cells_read += plan.cells_written
+    if parameters.get("cache_dir") and mdx_source:
+        # LastDataUpdate per read
+        calls["metadata"] += calls["read"]
+    if tidy:
+        calls["view delete"] += int(view_source is not None) + int(view_target is not None)
+    plan.calls = calls
+    return plan
@@ -0,0 +1,161 @@
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack
+from graphlib import TopologicalSorter
+from typing import Dict
+
+import yaml
+
+# concurrent jobs per TM1 instance, if not specified in the manifest
+DEFAULT_CONCURRENCY = 2
+
+
+def load_manifest(path) -> Dict:
+    """ Read and validate a job manifest
+
+    jobs:
+      - name: npv_projects
+        method: NPV
+        tm1_source: tm1srv01
+        ...
+        rate: 0.1
+      - name: irr_portfolio
+        method: IRR
+        depends_on: [npv_projects]
+        ...
+    concurrency:
+      tm1srv01: 4
+
+    :param path: path to the yaml file
+    :return: manifest as dictionary
+    """
+    with open(path, "r") as file:
+        manifest = yaml.safe_load(file)
+
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("jobs"), list):
+        raise ValueError(f"Manifest '{path}' must contain a list of 'jobs'")
+
+    names = set()
+    for job in manifest["jobs"]:
+        if "name" not in job or "method" not in job:
+            raise ValueError(f"Every job needs a 'name' and a 'method'. Invalid job: {job}")
+        if job["name"] in names:
+            raise ValueError(f"Job name '{job['name']}' is not unique")
+        names.add(job["name"])
+
+    for job in manifest["jobs"]:
+        for dependency in job.get("depends_on", []):
+            if dependency not in names:
+                raise ValueError(f"Job '{job['name']}' depends on unknown job '{dependency}'")
+    return manifest
+
+
+class JobScheduler:
+    """ Run the jobs of a manifest with shared connections.
+
+    Independent jobs run concurrently, limited per TM1 instance. Dependent jobs start once all their
+    dependencies succeeded and are skipped if one of them failed.
+    """
+
+    def __init__(self, calculator, manifest: Dict):
+        self.calculator = calculator
+        self.jobs: Dict[str, Dict] = {job["name"]: job for job in manifest["jobs"]}
+        concurrency = manifest.get("concurrency", dict())
+        limits = {instance: int(concurrency.get(instance, DEFAULT_CONCURRENCY))
+                  for instance
+                  in calculator.tm1_services}
+        self.limits = {instance: threading.BoundedSemaphore(limit) for instance, limit in limits.items()}
+        self.workers = int(manifest.get("workers", sum(limits.values()) or 1))
+        self.results: Dict[str, Dict] = dict()
+
+    def run(self) -> bool:
+        """ run all jobs in topological order
+
+        :return: True if all jobs succeeded
+        """
+        sorter = TopologicalSorter({name: job.get("depends_on", []) for name, job in self.jobs.items()})
+        sorter.prepare()
+        start = datetime.datetime.now()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            running = dict()
+            while sorter.is_active():
+                for name in sorter.get_ready():
+                    if all(self.results[dependency]["status"] == "succeeded"
+                           for dependency
+                           in self.jobs[name].get("depends_on", [])):
+                        running[executor.submit(self.run_job, name)] = name
+                    else:
+                        self.results[name] = {"status": "skipped", "start": None, "duration": None}
+                        sorter.done(name)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sorter.done(running.pop(future))
+
+        self.report(datetime.datetime.now() - start)
+        return all(result["status"] == "succeeded" for result in self.results.values())
+
+    def run_job(self, name: str):
+        parameters = {key: value
+                      for key, value
+                      in self.jobs[name].items()
+                      if key not in ("name", "method", "depends_on")}
+        instances = sorted({parameters.get("tm1_source"), parameters.get("tm1_target")} - {None})
+
+        success, start = False, None
+        try:
+            # acquire in sorted order, so jobs on several instances can not deadlock
+            with ExitStack() as stack:
+                for instance in instances:
+                    if instance in self.limits:
+                        stack.enter_context(self.limits[instance])
+                start = datetime.datetime.now()
+                logging.info(f"Starting job '{name}'")
+                success = self.calculator.run(self.jobs[name]["method"], parameters)
+        finally:
+            self.results[name] = {
+                "status": "succeeded" if success else "failed",
+                "start": start,
+                "duration": datetime.datetime.now() - start if start else None}
+
+    def report(self, elapsed_time):
+        """ log one consolidated timing report for all jobs """
+        lines = [f"{'Job':<40}{'Method':<20}{'Status':<12}{'Start':<18}Duration"]
+        for name, job in self.jobs.items():
+            result = self.results.get(name, {"status": "not run", "start": None, "duration": None})
+            lines.append("{name:<40}{method:<20}{status:<12}{start:<18}{duration}".format(
+                name=name,
+                method=job["method"],
+                status=result["status"],
+                start=result["start"].strftime("%H:%M:%S.%f")[:-3] if result["start"] else "-",
+                duration=str(result["duration"]) if result["duration"] else "-"))
+
+        statuses = [result["status"] for result in self.results.values()]
+        lines.append("{jobs} jobs: {succeeded} succeeded, {failed} failed, {skipped} skipped. Duration: {elapsed}".format(
+            jobs=len(self.jobs),
+            succeeded=statuses.count("succeeded"),
+            failed=statuses.count("failed"),
+            skipped=statuses.count("skipped"),
+            elapsed=str(elapsed_time)))
+        logging.info("Job report:\n" + "\n".join(lines))
+
+
+def run_jobs(calculator, path) -> bool:
+    """ run all jobs from a manifest file and logout afterwards
+
+    :param calculator: CubeCalc instance with connections
+    :param path: path to the manifest
+    :return: True if all jobs succeeded
+    """
+    try:
+        manifest = load_manifest(path)
+        return JobScheduler(calculator, manifest).run()
+    except Exception as ex:
+        logging.exception(f"Failed running jobs from manifest '{path}'. Error: {str(ex)}")
+        return False
+    finally:
+        calculator.logout()
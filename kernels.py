@@ -0,0 +1,118 @@
+""" Numerical kernels of loop heavy methods.
+
+Every kernel has a loop implementation, which is JIT-compiled with Numba when it is installed, and a NumPy
+implementation, which is used without Numba. fv_schedule has no NumPy implementation: np.prod rounds differently
+than compounding period by period, so the plain loop is used without Numba.
+Run this module to compare the backends: python kernels.py
+"""
+import timeit
+
+import numpy as np
+
+try:
+    import numba
+
+    JIT_AVAILABLE = True
+except ImportError:
+    numba = None
+    JIT_AVAILABLE = False
+
+BACKEND = "numba" if JIT_AVAILABLE else "numpy"
+
+XIRR_TOLERANCE = 1.48e-8
+XIRR_MAXITER = 50
+
+
+def fv_schedule_loop(principal, rates):
+    value = principal
+    for rate in rates:
+        value += value * rate
+    return value
+
+
+def xnpv_numpy(rate, values, years):
+    return np.sum(values / (1 + rate) ** years)
+
+
+def xnpv_loop(rate, values, years):
+    total = 0.0
+    for i in range(len(values)):
+        total += values[i] / (1 + rate) ** years[i]
+    return total
+
+
+def xirr_numpy(values, years, guess):
+    """ Newton iterations on xnpv with the analytic derivative. NaN if there is no convergence """
+    rate = guess
+    for _ in range(XIRR_MAXITER):
+        discount = (1 + rate) ** -years
+        value = np.sum(values * discount)
+        derivative = np.sum(-years * values * discount) / (1 + rate)
+        if derivative == 0:
+            return np.nan
+        step = value / derivative
+        rate -= step
+        if abs(step) < XIRR_TOLERANCE:
+            return rate
+    return np.nan
+
+
+def xirr_loop(values, years, guess):
+    rate = guess
+    for _ in range(XIRR_MAXITER):
+        value = 0.0
+        derivative = 0.0
+        for i in range(len(values)):
+            discount = (1 + rate) ** -years[i]
+            value += values[i] * discount
+            derivative -= years[i] * values[i] * discount / (1 + rate)
+        if derivative == 0:
+            return np.nan
+        step = value / derivative
+        rate -= step
+        if abs(step) < XIRR_TOLERANCE:
+            return rate
+    return np.nan
+
+
+if JIT_AVAILABLE:
+    fv_schedule_kernel = numba.njit(cache=True)(fv_schedule_loop)
+    xnpv_kernel = numba.njit(cache=True)(xnpv_loop)
+    xirr_kernel = numba.njit(cache=True)(xirr_loop)
+else:
+    fv_schedule_kernel = fv_schedule_loop
+    xnpv_kernel = xnpv_numpy
+    xirr_kernel = xirr_numpy
+
+
+def benchmark(periods=1000, number=200):
+    """ Seconds per call of every kernel and backend. The loop backend without Numba is plain Python
+
+    :return: dictionary kernel: {backend: seconds}
+    """
+    rng = np.random.default_rng(0)
+    rates = rng.uniform(0, 0.05, periods)
+    values = np.concatenate([[-periods * 100.0], rng.uniform(50, 150, periods - 1)])
+    years = np.arange(periods, dtype=np.float64) / 12
+
+    candidates = {
+        "fv_schedule": ((None, fv_schedule_loop, fv_schedule_kernel), (100.0, rates)),
+        "xnpv": ((xnpv_numpy, xnpv_loop, xnpv_kernel), (0.05, values, years)),
+        "xirr": ((xirr_numpy, xirr_loop, xirr_kernel), (values, years, 0.1))}
+    results = dict()
+    for name, ((numpy_kernel, loop_kernel, kernel), arguments) in candidates.items():
+        # compile before timing
+        kernel(*arguments)
+        results[name] = {"python loop": timeit.timeit(lambda: loop_kernel(*arguments), number=number) / number}
+        if numpy_kernel:
+            results[name]["numpy"] = timeit.timeit(lambda: numpy_kernel(*arguments), number=number) / number
+        if JIT_AVAILABLE:
+            results[name]["numba"] = timeit.timeit(lambda: kernel(*arguments), number=number) / number
+    return results
+
+
+if __name__ == "__main__":
+    print(f"Selected backend: {BACKEND}")
+    for kernel_name, timings in benchmark().items():
+        print(kernel_name + ": " + ", ".join(
+            f"{backend} {seconds * 1e6:.1f} µs" for backend, seconds in timings.items()))
@@ -1,14 +1,23 @@
 import functools
+import logging
 import re
 import statistics
+import types
 from datetime import date, datetime
 
 import numpy_financial as npf
 import numpy as np
 from dateutil import parser
-from scipy import optimize, stats
+from scipy import stats
 import calendar
 
+from cache import read_rows_and_values
+from kernels import fv_schedule_kernel, xirr_kernel, xnpv_kernel
+from sketches import HyperLogLog, KllSketch
+
+# cells per request when streaming the source
+STREAM_CHUNK_SIZE = 100_000
+
 
 
 from datetime import date
@@ -88,45 +97,250 @@ def generate_dates_from_rows(rows):
     return dates
 
 
+def rows_and_values_to_series(rows_and_values):
+    """Split the rows and values of a cellset into the values of the first column and the row dates"""
+    values = [values_by_row[0] for values_by_row in rows_and_values.values()]
+    dates = generate_dates_from_rows(rows_and_values.keys())
+    return values, dates
+
+
+def rows_and_values_to_matrix(rows_and_values):
+    """Rows and values of a cellset as row names and a 2-D array (rows x columns)"""
+    matrix = np.array(
+        [[value or 0 for value in values_by_row] for values_by_row in rows_and_values.values()],
+        dtype=np.float64,
+    )
+    return list(rows_and_values.keys()), matrix
+
+
+def cell_values(result):
+    """Values to write into the target view for a result.
+
+    Series results fill one cell per value, matrices are written row by row.
+    Undefined values (e.g. before the first full window) are written as 0
+    """
+    if isinstance(result, (np.ndarray, list, tuple)):
+        return [float(value) if np.isfinite(value) else 0 for value in np.ravel(result)]
+    return (result,)
+
+
+def cube_of_mdx(mdx):
+    """Name of the cube in the FROM clause of an MDX query"""
+    match = re.search(r"FROM\s*\[(.*?)\]", mdx, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"No cube found in MDX: '{mdx}'")
+    return match.group(1)
+
+
+def _read_source(kwargs):
+    """Rows and values of the source MDX or view. None if neither is passed"""
+    if "tm1_services" in kwargs and "tm1_source" in kwargs and "mdx_source" in kwargs:
+        tm1 = kwargs["tm1_services"][kwargs["tm1_source"]]
+        return read_rows_and_values(
+            tm1,
+            kwargs["tm1_source"],
+            kwargs.get("cube_source") or cube_of_mdx(kwargs["mdx_source"]),
+            kwargs["mdx_source"],
+            kwargs.get("cache_dir"),
+        )
+    if (
+        "tm1_services" in kwargs
+        and "tm1_source" in kwargs
+        and "cube_source" in kwargs
+        and "view_source" in kwargs
+    ):
+        tm1 = kwargs["tm1_services"][kwargs["tm1_source"]]
+        if kwargs.get("cache_dir"):
+            mdx = tm1.cubes.views.get(
+                cube_name=kwargs["cube_source"],
+                view_name=kwargs["view_source"],
+                private=False,
+            ).MDX
+            return read_rows_and_values(
+                tm1, kwargs["tm1_source"], kwargs["cube_source"], mdx, kwargs["cache_dir"]
+            )
+        return tm1.cubes.cells.execute_view_rows_and_values(
+            cube_name=kwargs["cube_source"],
+            view_name=kwargs["view_source"],
+            private=False,
+            element_unique_names=False,
+        )
+    return None
+
+
+def _write_target(kwargs, result):
+    """Write result to the target MDX, the target coordinates or the target view if passed"""
+    if "tm1_services" not in kwargs or "tm1_target" not in kwargs:
+        return
+    tm1 = kwargs["tm1_services"][kwargs["tm1_target"]]
+
+    if "mdx_target" in kwargs:
+        cube = kwargs.get("cube_target") or cube_of_mdx(kwargs["mdx_target"])
+        mdx = kwargs["mdx_target"]
+    elif "target_coordinates" in kwargs and "cube_target" in kwargs:
+        values = cell_values(result)
+        if len(values) != 1:
+            raise ValueError(
+                f"'target_coordinates' take a single value. Got {len(values)} values"
+            )
+        coordinates = tuple(kwargs["target_coordinates"].split(","))
+        tolerance = write_tolerance(kwargs)
+        if tolerance is not None and _unchanged(
+            tm1.cells.get_value(kwargs["cube_target"], kwargs["target_coordinates"]),
+            values[0],
+            tolerance,
+        ):
+            logging.info("Suppressed 1 unchanged writes")
+            return
+        tm1.cells.write_value(values[0], kwargs["cube_target"], coordinates)
+        return
+    elif "cube_target" in kwargs and "view_target" in kwargs:
+        cube = kwargs["cube_target"]
+        mdx = tm1.cubes.views.get(
+            cube_name=kwargs["cube_target"],
+            view_name=kwargs["view_target"],
+            private=False,
+        ).MDX
+    else:
+        return
+
+    suppressed = write_cell_values(
+        tm1, cube, mdx, cell_values(result), write_tolerance(kwargs)
+    )
+    if suppressed:
+        logging.info(f"Suppressed {suppressed} unchanged writes")
+
+
+def write_tolerance(parameters):
+    """Tolerance of the write-diff mode or None if every cell is written"""
+    if parameters.get("write_diff") in ("True", "true", "TRUE", "1", 1):
+        return float(parameters.get("write_tolerance", 0))
+    return None
+
+
+def write_cell_values(tm1, cube, mdx, values, tolerance=None):
+    """Write values into the cells of the MDX in cellset order.
+
+    With a tolerance the current values are read first (one request for all cells) and only
+    cells that differ by more than the tolerance are written.
+
+    :return: number of suppressed writes
+    """
+    if tolerance is None:
+        tm1.cells.write_values_through_cellset(mdx=mdx, values=values)
+        return 0
+
+    current_values = tm1.cells.execute_mdx(
+        mdx=mdx, element_unique_names=False, skip_cell_properties=True
+    )
+    changes = {
+        coordinates: value
+        for (coordinates, current_value), value in zip(current_values.items(), values)
+        if not _unchanged(current_value, value, tolerance)
+    }
+    if changes:
+        tm1.cells.write_values(cube, changes)
+    return min(len(current_values), len(values)) - len(changes)
+
+
+def _unchanged(current_value, value, tolerance):
+    if isinstance(current_value, str) or isinstance(value, str):
+        return current_value == value
+    # empty numeric cells hold 0
+    return abs((current_value or 0) - value) <= tolerance
+
+
 def tm1_io(func):
     """Higher Order Function to read values from source and write result to target view"""
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         # read values from view
-        if (
-            "tm1_services" in kwargs
-            and "tm1_source" in kwargs
-            and "cube_source" in kwargs
-            and "view_source" in kwargs
-        ):
-            tm1 = kwargs["tm1_services"][kwargs["tm1_source"]]
-            if "values" not in kwargs:
-                rows_and_values = tm1.cubes.cells.execute_view_rows_and_values(
-                    cube_name=kwargs["cube_source"],
-                    view_name=kwargs["view_source"],
-                    private=False,
-                    element_unique_names=False,
+        if "values" not in kwargs:
+            rows_and_values = _read_source(kwargs)
+            if rows_and_values is not None:
+                kwargs["values"], kwargs["dates"] = rows_and_values_to_series(
+                    rows_and_values
                 )
-                kwargs["values"] = [
-                    values_by_row[0] for values_by_row in rows_and_values.values()
-                ]
-                kwargs["dates"] = generate_dates_from_rows(rows_and_values.keys())
         result = func(*args, **kwargs)
         # write result to source view
+        _write_target(kwargs, result)
+        return result
+
+    return wrapper
+
+
+def _stream_source(kwargs):
+    """Numeric cell values of the source MDX or view in chunks of stream_chunk_size cells.
+    The cellset is created once and extracted page by page, so only one chunk is held in memory
+    """
+    chunk_size = int(kwargs.get("stream_chunk_size", STREAM_CHUNK_SIZE))
+    tm1 = kwargs["tm1_services"][kwargs["tm1_source"]]
+    if "mdx_source" in kwargs:
+        mdx = kwargs["mdx_source"]
+    else:
+        mdx = tm1.cubes.views.get(
+            cube_name=kwargs["cube_source"],
+            view_name=kwargs["view_source"],
+            private=False,
+        ).MDX
+    cellset_id = tm1.cells.create_cellset(mdx)
+    try:
+        skip = 0
+        while True:
+            cells = tm1.cells.extract_cellset_cells_raw(
+                cellset_id, top=chunk_size, skip=skip
+            )["Cells"]
+            yield np.array(
+                [
+                    cell["Value"]
+                    for cell in cells
+                    if isinstance(cell["Value"], (int, float))
+                ],
+                dtype=np.float64,
+            )
+            if len(cells) < chunk_size:
+                return
+            skip += chunk_size
+    finally:
+        tm1.cells.delete_cellset(cellset_id)
+
+
+def tm1_io_stream(func):
+    """Higher Order Function to stream the values of the source in chunks (passed as values)
+    and write the result to the target view"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
         if (
-            "tm1_services" in kwargs
-            and "tm1_target" in kwargs
-            and "cube_target" in kwargs
-            and "view_target" in kwargs
+            not args
+            and "values" not in kwargs
+            and "tm1_services" in kwargs
+            and "tm1_source" in kwargs
+            and ("mdx_source" in kwargs or "view_source" in kwargs)
         ):
-            tm1 = kwargs["tm1_services"][kwargs["tm1_target"]]
-            mdx = tm1.cubes.views.get(
-                cube_name=kwargs["cube_target"],
-                view_name=kwargs["view_target"],
-                private=False,
-            ).MDX
-            tm1.cubes.cells.write_values_through_cellset(mdx=mdx, values=(result,))
+            kwargs["values"] = _stream_source(kwargs)
+        result = func(*args, **kwargs)
+        _write_target(kwargs, result)
+        return result
+
+    return wrapper
+
+
+def tm1_io_matrix(func):
+    """Higher Order Function to read the full source view as a matrix (one row per view row)
+    and write the result (any shape, row by row) to the target view"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if "matrix" not in kwargs:
+            rows_and_values = _read_source(kwargs)
+            if rows_and_values is not None:
+                kwargs["rows"], kwargs["matrix"] = rows_and_values_to_matrix(
+                    rows_and_values
+                )
+        result = func(*args, **kwargs)
+        _write_target(kwargs, result)
         return result
 
     return wrapper
@@ -176,6 +390,17 @@ def tm1_tidy(func):
     return wrapper
 
 
+def _is_vector(*parameters):
+    return any(isinstance(parameter, (list, tuple, np.ndarray)) for parameter in parameters)
+
+
+def _numeric(parameter):
+    """float for scalar parameters (also CLI strings), float array for parameters with one value per element"""
+    if _is_vector(parameter):
+        return np.asarray(parameter, dtype=np.float64)
+    return float(parameter)
+
+
 def _nroot(value, n):
     """
     Returns the nth root of the given value.
@@ -222,7 +447,11 @@ def fv(rate, nper, pmt, pv, when=0, *args, **kwargs):
     :return:
     """
     return npf.fv(
-        rate=float(rate), nper=float(nper), pmt=float(pmt), pv=float(pv), when=int(when)
+        rate=_numeric(rate),
+        nper=_numeric(nper),
+        pmt=_numeric(pmt),
+        pv=_numeric(pv),
+        when=int(when),
     )
 
 
@@ -235,7 +464,7 @@ def fv_schedule(principal, values, *args, **kwargs):
     :param values: A series of interest rate
     :return:
     """
-    return functools.reduce(lambda x, y: x + (x * y), values, float(principal))
+    return float(fv_schedule_kernel(float(principal), np.asarray(values, dtype=np.float64)))
 
 
 @tm1_tidy
@@ -251,7 +480,11 @@ def pv(rate, nper, pmt, fv, when=0, *args, **kwargs):
     :return:
     """
     return npf.pv(
-        rate=float(rate), nper=float(nper), pmt=float(pmt), fv=float(fv), when=int(when)
+        rate=_numeric(rate),
+        nper=_numeric(nper),
+        pmt=_numeric(pmt),
+        fv=_numeric(fv),
+        when=int(when),
     )
 
 
@@ -262,21 +495,29 @@ def xnpv(rate, values, dates, *args, **kwargs):
 
     :param rate: Discount rate for a period
     :param values: Positive or negative cash flows
-    :param dates: Specific dates
+    :param dates: Specific dates or their ordinals
     :return:
     """
     rate = float(rate)
     if len(values) != len(dates):
         raise ValueError("values and dates must be the same length")
-    if sorted(dates) != dates:
+    years = _years(dates)
+    if np.any(np.diff(years) < 0):
         raise ValueError("dates must be in chronological order")
-    first_date = dates[0]
-    return sum(
-        [
-            value / ((1 + rate) ** ((date - first_date).days / 365.0))
-            for (value, date) in zip(values, dates)
-        ]
-    )
+    return float(xnpv_kernel(rate, np.asarray(values, dtype=np.float64), years))
+
+
+def date_ordinals(dates):
+    """Proleptic ordinals of dates. Arrays of ordinals (e.g. from a snapshot) are passed through"""
+    if isinstance(dates, np.ndarray):
+        return dates.astype(np.int64, copy=False)
+    return np.array([date.toordinal() for date in dates], dtype=np.int64)
+
+
+def _years(dates):
+    """years since the first date, with 365 days per year"""
+    days = date_ordinals(dates).astype(np.float64)
+    return (days - days[0]) / 365.0
 
 
 @tm1_tidy
@@ -292,7 +533,11 @@ def pmt(rate, nper, pv, fv=0, when=0, *args, **kwargs):
     :return:
     """
     return npf.pmt(
-        rate=float(rate), nper=float(nper), pv=float(pv), fv=float(fv), when=int(when)
+        rate=_numeric(rate),
+        nper=_numeric(nper),
+        pv=_numeric(pv),
+        fv=_numeric(fv),
+        when=int(when),
     )
 
 
@@ -319,6 +564,176 @@ def ppmt(rate, per, nper, pv, fv=0, when=0, *args, **kwargs):
     )
 
 
+@tm1_tidy
+@tm1_io
+def ipmt(rate, per, nper, pv, fv=0, when=0, *args, **kwargs):
+    """calculates the interest portion of a payment with a constant interest rate and constant periodic payments
+
+    :param rate: Interest rate/period
+    :param per: The period for which the interest is to be calculated
+    :param nper: Number of periods
+    :param pv: Present Value
+    :param fv: Future Value, if not assigned 0 is assumed
+    :param when: 0 or 1. When the payment is made (Default: the payment is made at the end of the period)
+    :return:
+    """
+    return npf.ipmt(
+        rate=float(rate),
+        per=float(per),
+        nper=float(nper),
+        pv=float(pv),
+        fv=float(fv),
+        when=int(when),
+    )
+
+
+def _amortization_schedule(rate, nper, pv, fv=0, when=0, periods=None):
+    """Payment, interest, principal and remaining balance for every loan and period
+
+    All parameters are scalars or arrays with one entry per loan.
+    :return: array (loans x periods x 4). Periods after the end of a loan are 0
+    """
+    rate, nper, pv, fv, when = (
+        np.atleast_1d(np.asarray(parameter, dtype=np.float64))[:, None]
+        for parameter in (rate, nper, pv, fv, when)
+    )
+    periods = int(periods) if periods else int(np.ceil(nper.max()))
+    per = np.arange(1, periods + 1, dtype=np.float64)[None, :]
+    active = per <= nper
+    interest = np.where(active, npf.ipmt(rate, per, nper, pv, fv, when), 0)
+    principal = np.where(active, npf.ppmt(rate, per, nper, pv, fv, when), 0)
+    balance = np.where(active, pv + np.cumsum(principal, axis=1), 0)
+    return np.stack([interest + principal, interest, principal, balance], axis=-1)
+
+
+@tm1_tidy
+@tm1_io_matrix
+def amortization_schedule(
+    rate=None, nper=None, pv=None, fv=0, when=0, periods=None, matrix=None, *args, **kwargs
+):
+    """Full loan schedule: payment, interest, principal and remaining balance per period
+
+    Either pass scalar loan parameters or a source view with one row per loan and the columns
+    rate, nper, pv and optionally fv and when (in that order).
+    The target view must hold loans x periods rows (loans outer) and 4 columns: payment, interest, principal, balance.
+
+    :param rate: Interest rate/period
+    :param nper: Number of periods
+    :param pv: Present Value
+    :param fv: Future Value, if not assigned 0 is assumed
+    :param when: 0 or 1. When the payment is made (Default: the payment is made at the end of the period)
+    :param periods: Number of periods in the schedule. Default: the longest loan
+    :param matrix: loan parameters, one row per loan
+    :return: array (loans x periods x 4)
+    """
+    if matrix is not None:
+        matrix = np.atleast_2d(matrix)
+        rate, nper, pv = matrix[:, 0], matrix[:, 1], matrix[:, 2]
+        if matrix.shape[1] > 3:
+            fv = matrix[:, 3]
+        if matrix.shape[1] > 4:
+            when = matrix[:, 4]
+    else:
+        rate, nper, pv, fv, when = float(rate), float(nper), float(pv), float(fv), int(when)
+    return _amortization_schedule(rate, nper, pv, fv, when, periods)
+
+
+def _asset_parameters(matrix, cost, salvage, life, extra, extra_default):
+    """cost, salvage, life and one optional method parameter as column vectors (assets x 1)
+
+    Either scalars or a source view with one row per asset and the columns cost, salvage, life (and extra)
+    """
+    if matrix is not None:
+        matrix = np.atleast_2d(matrix)
+        cost, salvage, life = matrix[:, 0], matrix[:, 1], matrix[:, 2]
+        extra = matrix[:, 3] if matrix.shape[1] > 3 else extra_default
+    elif extra is None:
+        extra = extra_default
+    return (
+        np.atleast_1d(np.asarray(parameter, dtype=np.float64))[:, None]
+        for parameter in (cost, salvage, life, extra)
+    )
+
+
+def _schedule_periods(life, periods):
+    """Periods 1..n as row vector (1 x periods). Default: the longest life"""
+    periods = int(periods) if periods else int(np.ceil(life.max()))
+    return np.arange(1, periods + 1, dtype=np.float64)[None, :]
+
+
+@tm1_tidy
+@tm1_io_matrix
+def sln_schedule(cost=None, salvage=None, life=None, periods=None, matrix=None, *args, **kwargs):
+    """Straight-line depreciation for every asset and period
+
+    :param cost: Cost of asset when bought (initial amount)
+    :param salvage: Value of asset after depreciation
+    :param life: Number of periods over which the asset is being depreciated
+    :param periods: Number of periods in the schedule. Default: the longest life
+    :param matrix: asset register, one row per asset with the columns cost, salvage, life
+    :return: array (assets x periods). Periods after the end of the life are 0
+    """
+    cost, salvage, life, _ = _asset_parameters(matrix, cost, salvage, life, None, 0)
+    per = _schedule_periods(life, periods)
+    return np.where(per <= life, (cost - salvage) / life, 0)
+
+
+@tm1_tidy
+@tm1_io_matrix
+def syd_schedule(cost=None, salvage=None, life=None, periods=None, matrix=None, *args, **kwargs):
+    """Sum-of-years' digits depreciation for every asset and period
+
+    :param matrix: asset register, one row per asset with the columns cost, salvage, life
+    :return: array (assets x periods). Periods after the end of the life are 0
+    """
+    cost, salvage, life, _ = _asset_parameters(matrix, cost, salvage, life, None, 0)
+    per = _schedule_periods(life, periods)
+    return np.where(per <= life, (cost - salvage) * (life - per + 1) * 2 / (life * (life + 1)), 0)
+
+
+@tm1_tidy
+@tm1_io_matrix
+def ddb_schedule(
+    cost=None, salvage=None, life=None, factor=None, periods=None, matrix=None, *args, **kwargs
+):
+    """Double-declining (or any factor) balance depreciation for every asset and period, as Excel DDB
+
+    :param factor: Rate at which the balance declines. Default: 2 (double-declining)
+    :param matrix: asset register, one row per asset with the columns cost, salvage, life (and factor)
+    :return: array (assets x periods)
+    """
+    cost, salvage, life, factor = _asset_parameters(matrix, cost, salvage, life, factor, 2)
+    per = _schedule_periods(life, periods)
+    rate = np.minimum(factor / life, 1)
+    # book value at the start of the period. Once the salvage value is reached the depreciation is 0
+    book = cost * (1 - rate) ** (per - 1)
+    depreciation = np.clip(np.minimum(book * rate, book - salvage), 0, None)
+    return np.where(per <= life, depreciation, 0)
+
+
+@tm1_tidy
+@tm1_io_matrix
+def db_schedule(
+    cost=None, salvage=None, life=None, month=None, periods=None, matrix=None, *args, **kwargs
+):
+    """Fixed-declining balance depreciation for every asset and period, as Excel DB
+
+    :param month: Number of months in the first year. Default: 12. With less than 12 months the schedule
+    has life + 1 periods
+    :param matrix: asset register, one row per asset with the columns cost, salvage, life (and month)
+    :return: array (assets x periods)
+    """
+    cost, salvage, life, month = _asset_parameters(matrix, cost, salvage, life, month, 12)
+    per = _schedule_periods(life + (month < 12), periods)
+    rate = np.round(1 - (salvage / cost) ** (1 / life), 3)
+    first = cost * rate * month / 12
+    # book value at the start of every period after the first
+    book = (cost - first) * (1 - rate) ** np.maximum(per - 2, 0)
+    depreciation = np.where(per == 1, first, book * rate)
+    depreciation = np.where(per == life + 1, book * rate * (12 - month) / 12, depreciation)
+    return np.where(per <= life + (month < 12), depreciation, 0)
+
+
 @tm1_tidy
 @tm1_io
 def mirr(values, finance_rate, reinvest_rate, *args, **kwargs):
@@ -342,11 +757,19 @@ def xirr(values, dates, guess=0.1, *args, **kwargs):
     """Returns the internal rate of return for a schedule of cash flows that is not necessarily periodic.
 
     :param values: Positive or negative cash flows
-    :param dates: Specific dates
+    :param dates: Specific dates or their ordinals
     :param guess: An assumption of what you think IRR should be
     :return:
     """
-    return optimize.newton(lambda r: xnpv(r, values, dates), float(guess))
+    if len(values) != len(dates):
+        raise ValueError("values and dates must be the same length")
+    years = _years(dates)
+    if np.any(np.diff(years) < 0):
+        raise ValueError("dates must be in chronological order")
+    result = xirr_kernel(np.asarray(values, dtype=np.float64), years, float(guess))
+    if np.isnan(result):
+        raise RuntimeError(f"XIRR failed to converge with guess {guess}")
+    return float(result)
 
 
 @tm1_tidy
@@ -361,9 +784,14 @@ def nper(rate, pmt, pv, fv=0, when=0, *args, **kwargs):
     :param when: 0 or 1. When the payment is made (Default: the payment is made at the end of the period)
     :return:
     """
-    return npf.nper(
-        rate=float(rate), pmt=float(pmt), pv=float(pv), fv=float(fv), when=int(when)
-    ).item(0)
+    result = npf.nper(
+        rate=_numeric(rate),
+        pmt=_numeric(pmt),
+        pv=_numeric(pv),
+        fv=_numeric(fv),
+        when=int(when),
+    )
+    return result if _is_vector(rate, pmt, pv, fv) else result.item(0)
 
 
 @tm1_tidy
@@ -381,10 +809,10 @@ def rate(nper, pmt, pv, fv=0, when=0, guess=0.1, maxiter=100, *args, **kwargs):
     :return:
     """
     return npf.rate(
-        nper=float(nper),
-        pmt=float(pmt),
-        pv=float(pv),
-        fv=float(fv),
+        nper=_numeric(nper),
+        pmt=_numeric(pmt),
+        pv=_numeric(pv),
+        fv=_numeric(fv),
         when=int(when),
         guess=float(guess),
         maxiter=int(maxiter),
@@ -401,7 +829,7 @@ def effect(nominal_rate, npery, *args, **kwargs):
     :param npery: Number of compounding per year
     :return:
     """
-    nominal_rate, npery = float(nominal_rate), float(npery)
+    nominal_rate, npery = _numeric(nominal_rate), _numeric(npery)
     return ((1 + (nominal_rate / npery)) ** npery) - 1
 
 
@@ -414,7 +842,7 @@ def nominal(effect_rate, npery, *args, **kwargs):
     :param npery: Number of compounding per year
     :return:
     """
-    effect_rate, npery = float(effect_rate), float(npery)
+    effect_rate, npery = _numeric(effect_rate), _numeric(npery)
     return (_nroot(effect_rate + 1, npery) - 1) * npery
 
 
@@ -428,7 +856,7 @@ def sln(cost, salvage, life, *args, **kwargs):
     :param life: Number of periods over which the asset is being depreciated
     :return:
     """
-    return (float(cost) - float(salvage)) / float(life)
+    return (_numeric(cost) - _numeric(salvage)) / _numeric(life)
 
 
 @tm1_tidy
@@ -450,7 +878,58 @@ def sem(values, *args, **kwargs):
 @tm1_tidy
 @tm1_io
 def median(values, *args, **kwargs):
-    return statistics.median(values)
+    return float(median_rows(np.asarray(values, dtype=np.float64)[np.newaxis, :])[0])
+
+
+@tm1_tidy
+@tm1_io
+def quantile(values, quantiles, *args, **kwargs):
+    """
+    Any number of quantiles (e.g. '0.1,0.5,0.9') of the values with linear interpolation
+    :param values:
+    :param quantiles: quantiles between 0 and 1 as list or range (see parse_grid)
+    :return: one value per quantile
+    """
+    return quantile_rows(np.asarray(values, dtype=np.float64)[np.newaxis, :], quantiles)[0]
+
+
+@tm1_tidy
+@tm1_io
+def percentile(values, percentiles, *args, **kwargs):
+    """
+    Any number of percentiles (e.g. '10,50,90') of the values with linear interpolation
+    :param values:
+    :param percentiles: percentiles between 0 and 100 as list or range (see parse_grid)
+    :return: one value per percentile
+    """
+    return percentile_rows(np.asarray(values, dtype=np.float64)[np.newaxis, :], percentiles)[0]
+
+
+def quantile_rows(matrix, quantiles, *args, **kwargs):
+    """Quantiles of every row of a 2-D array (rows x quantiles).
+
+    Uses O(n) selection with np.partition instead of sorting. Same results as np.quantile (linear method)
+    """
+    quantiles = parse_grid(quantiles)
+    if np.any((quantiles < 0) | (quantiles > 1)):
+        raise ValueError("Quantiles must be between 0 and 1")
+    n = matrix.shape[1]
+    if n == 0:
+        raise ValueError("Quantiles require at least one value")
+    positions = quantiles * (n - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, n - 1)
+    partitioned = np.partition(matrix, np.unique(np.concatenate([lower, upper])), axis=1)
+    fraction = positions - lower
+    return partitioned[:, lower] * (1 - fraction) + partitioned[:, upper] * fraction
+
+
+def percentile_rows(matrix, percentiles, *args, **kwargs):
+    return quantile_rows(matrix, parse_grid(percentiles) / 100)
+
+
+def median_rows(matrix, *args, **kwargs):
+    return quantile_rows(matrix, 0.5)[:, 0]
 
 
 @tm1_tidy
@@ -526,3 +1005,463 @@ def sum_(values, *args, **kwargs):
 @tm1_io
 def count(values, *args, **kwargs):
     return len(set(values))
+
+
+@tm1_tidy
+@tm1_io_stream
+def approx_count(values, precision=14, *args, **kwargs):
+    """
+    Approximate distinct count (HyperLogLog) with bounded memory. Relative error about 1.04 / sqrt(2 ** precision)
+    :param values: values or chunks of values streamed from the source
+    :param precision: 4 to 18. 14 uses 16 KB and has a relative error of about 0.8%
+    :return:
+    """
+    sketch = HyperLogLog(int(precision))
+    for chunk in _chunks(values):
+        sketch.update(chunk)
+    return sketch.count()
+
+
+@tm1_tidy
+@tm1_io_stream
+def approx_quantile(values, quantiles, k=200, *args, **kwargs):
+    """
+    Approximate quantiles (KLL sketch) with bounded memory. Rank error about 1.7 / k
+    :param values: values or chunks of values streamed from the source
+    :param quantiles: quantiles between 0 and 1 as list or range (see parse_grid)
+    :param k: accuracy. 200 keeps about 600 values and has a rank error below 1%
+    :return: one value per quantile
+    """
+    sketch = KllSketch(int(k))
+    for chunk in _chunks(values):
+        sketch.update(chunk)
+    return sketch.quantiles(parse_grid(quantiles))
+
+
+@tm1_tidy
+@tm1_io_stream
+def approx_median(values, k=200, *args, **kwargs):
+    return float(approx_quantile(values=values, quantiles=0.5, k=k)[0])
+
+
+def _chunks(values):
+    """chunks streamed by tm1_io_stream or all values as one chunk"""
+    if isinstance(values, types.GeneratorType):
+        return values
+    return [np.asarray(values, dtype=np.float64)]
+
+
+def _rolling_sum(values, window):
+    """Sum over a sliding window from one cumulative sum. Positions before the first full window are NaN"""
+    window = int(window)
+    if window < 1:
+        raise ValueError("window must be a positive integer")
+    totals = np.cumsum(values, dtype=np.float64)
+    result = np.full(len(totals), np.nan)
+    if window <= len(totals):
+        result[window - 1] = totals[window - 1]
+        result[window:] = totals[window:] - totals[:-window]
+    return result
+
+
+def _cumulative_var(values):
+    # shift by the mean to avoid cancellation in E[x^2] - E[x]^2
+    centered = np.asarray(values, dtype=np.float64)
+    if not len(centered):
+        return centered
+    centered = centered - centered.mean()
+    count = np.arange(1, len(centered) + 1)
+    mean = np.cumsum(centered) / count
+    return np.maximum(np.cumsum(centered**2) / count - mean**2, 0)
+
+
+def _rolling_var(values, window):
+    centered = np.asarray(values, dtype=np.float64)
+    if not len(centered):
+        return centered
+    centered = centered - centered.mean()
+    mean = _rolling_sum(centered, window) / int(window)
+    return np.maximum(_rolling_sum(centered**2, window) / int(window) - mean**2, 0)
+
+
+def _discount_factors(rate, length):
+    return (1 + float(rate)) ** -np.arange(length, dtype=np.float64)
+
+
+@tm1_tidy
+@tm1_io
+def cumulative_sum(values, *args, **kwargs):
+    return np.cumsum(values, dtype=np.float64)
+
+
+@tm1_tidy
+@tm1_io
+def rolling_sum(values, window, *args, **kwargs):
+    """Sum over the last `window` periods
+
+    :param values: series
+    :param window: number of periods in the window
+    :return: series of the same length as values
+    """
+    return _rolling_sum(values, window)
+
+
+@tm1_tidy
+@tm1_io
+def cumulative_mean(values, *args, **kwargs):
+    return np.cumsum(values, dtype=np.float64) / np.arange(1, len(values) + 1)
+
+
+@tm1_tidy
+@tm1_io
+def rolling_mean(values, window, *args, **kwargs):
+    return _rolling_sum(values, window) / int(window)
+
+
+@tm1_tidy
+@tm1_io
+def cumulative_var(values, *args, **kwargs):
+    return _cumulative_var(values)
+
+
+@tm1_tidy
+@tm1_io
+def rolling_var(values, window, *args, **kwargs):
+    return _rolling_var(values, window)
+
+
+@tm1_tidy
+@tm1_io
+def cumulative_stdev(values, *args, **kwargs):
+    return np.sqrt(_cumulative_var(values))
+
+
+@tm1_tidy
+@tm1_io
+def rolling_stdev(values, window, *args, **kwargs):
+    return np.sqrt(_rolling_var(values, window))
+
+
+@tm1_tidy
+@tm1_io
+def cumulative_npv(rate, values, *args, **kwargs):
+    """NPV of the cash flows up to each period
+
+    :param rate: Discount rate for a period
+    :param values: Positive or negative cash flows
+    :return: series of the same length as values
+    """
+    return np.cumsum(np.asarray(values, dtype=np.float64) * _discount_factors(rate, len(values)))
+
+
+@tm1_tidy
+@tm1_io
+def rolling_npv(rate, values, window, *args, **kwargs):
+    """NPV of the last `window` cash flows, discounted to the first period of the window
+
+    :param rate: Discount rate for a period
+    :param values: Positive or negative cash flows
+    :param window: number of periods in the window
+    :return: series of the same length as values
+    """
+    discounted = _rolling_sum(
+        np.asarray(values, dtype=np.float64) * _discount_factors(rate, len(values)), window
+    )
+    # move the discounting from the first period of the series to the first period of the window
+    window_start = np.arange(len(values)) - int(window) + 1
+    return discounted * (1 + float(rate)) ** window_start
+
+
+@tm1_tidy
+@tm1_io
+def cumulative_irr(values, *args, **kwargs):
+    """IRR of the cash flows up to each period. IRR has no closed form, so every period is solved separately"""
+    return np.array([npf.irr(values[: i + 1]) for i in range(len(values))])
+
+
+@tm1_tidy
+@tm1_io
+def rolling_irr(values, window, *args, **kwargs):
+    """IRR of the last `window` cash flows. IRR has no closed form, so every window is solved separately"""
+    window = int(window)
+    return np.array(
+        [
+            npf.irr(values[i - window + 1 : i + 1]) if i >= window - 1 else np.nan
+            for i in range(len(values))
+        ]
+    )
+
+
+def parse_grid(value):
+    """Parse a grid parameter into a 1-D array
+
+    Supports:
+      - Ranges 'start:stop:step' (stop is included), for example '0.05:0.15:0.0025'
+      - Lists '0.05,0.1,0.15'
+      - Scalars
+    """
+    if isinstance(value, str):
+        if ":" in value:
+            start, stop, step = (float(part) for part in value.split(":"))
+            if step == 0:
+                raise ValueError(f"Step must not be 0 in range: {value!r}")
+            # count the steps first, so float rounding neither drops nor overshoots the stop value
+            steps = int(np.floor((stop - start) / step + 0.5))
+            if steps < 0:
+                raise ValueError(f"Step points away from stop in range: {value!r}")
+            return np.linspace(start, start + steps * step, steps + 1)
+        return np.array([float(part) for part in value.split(",")])
+    return np.atleast_1d(np.asarray(value, dtype=np.float64))
+
+
+def _grid_axes(*parameters):
+    """Parse parameters into grid axes, shaped to broadcast against each other.
+
+    :return: broadcastable axes and the result shape (axes with a single value are dropped)
+    """
+    axes = [parse_grid(parameter) for parameter in parameters]
+    shape = [len(axis) for axis in axes if len(axis) > 1]
+    return np.ix_(*axes), shape
+
+
+def _series_matrix(values, matrix):
+    """Cash flows as 2-D array (periods x series)"""
+    series = np.asarray(matrix if matrix is not None else values, dtype=np.float64)
+    return series.reshape(len(series), -1)
+
+
+def _discount_matrix(rates, periods):
+    """Discount factors (rates x periods), first period undiscounted as in npv"""
+    return (1 + rates[:, None]) ** -np.arange(periods, dtype=np.float64)[None, :]
+
+
+@tm1_tidy
+@tm1_io_matrix
+def npv_grid(rate, values=None, matrix=None, *args, **kwargs):
+    """NPV for every combination of rate and series in one matrix multiplication
+
+    :param rate: grid of discount rates (range, list or scalar)
+    :param values: one series of cash flows
+    :param matrix: source view with one row per period and one column per series (e.g. growth scenarios)
+    :return: array (rates x series)
+    """
+    rates = parse_grid(rate)
+    series = _series_matrix(values, matrix)
+    return _discount_matrix(rates, len(series)) @ series
+
+
+@tm1_tidy
+@tm1_io_matrix
+def mirr_grid(finance_rate, reinvest_rate, values=None, matrix=None, *args, **kwargs):
+    """MIRR for every combination of finance rate, reinvest rate and series
+
+    :param finance_rate: grid of finance rates (range, list or scalar)
+    :param reinvest_rate: grid of reinvest rates (range, list or scalar)
+    :param values: one series of cash flows
+    :param matrix: source view with one row per period and one column per series
+    :return: array (finance rates x reinvest rates x series), axes with a single value are dropped
+    """
+    finance_rates, reinvest_rates = parse_grid(finance_rate), parse_grid(reinvest_rate)
+    series = _series_matrix(values, matrix)
+    periods = len(series)
+    # same definition as numpy_financial.mirr
+    numerator = np.abs(_discount_matrix(reinvest_rates, periods) @ np.where(series > 0, series, 0))
+    denominator = np.abs(_discount_matrix(finance_rates, periods) @ np.where(series < 0, series, 0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = (numerator[None, :, :] / denominator[:, None, :]) ** (1 / (periods - 1)) * (
+            1 + reinvest_rates[None, :, None]
+        ) - 1
+    valid = ((series > 0).any(axis=0) & (series < 0).any(axis=0))[None, None, :]
+    result = np.where(valid, result, np.nan)
+    return result.reshape(
+        [length for length in result.shape[:2] if length > 1] + [series.shape[1]]
+    )
+
+
+@tm1_tidy
+@tm1_io_matrix
+def fv_grid(rate, nper, pmt, pv, when=0, *args, **kwargs):
+    """FV for every combination of the grid parameters (ranges, lists or scalars)
+
+    :return: array with one axis per parameter with more than one value, in argument order
+    """
+    (rate, nper, pmt, pv), shape = _grid_axes(rate, nper, pmt, pv)
+    return npf.fv(rate=rate, nper=nper, pmt=pmt, pv=pv, when=int(when)).reshape(shape)
+
+
+@tm1_tidy
+@tm1_io_matrix
+def pv_grid(rate, nper, pmt, fv=0, when=0, *args, **kwargs):
+    """PV for every combination of the grid parameters (ranges, lists or scalars)
+
+    :return: array with one axis per parameter with more than one value, in argument order
+    """
+    (rate, nper, pmt, fv), shape = _grid_axes(rate, nper, pmt, fv)
+    return npf.pv(rate=rate, nper=nper, pmt=pmt, fv=fv, when=int(when)).reshape(shape)
+
+
+@tm1_tidy
+@tm1_io_matrix
+def pmt_grid(rate, nper, pv, fv=0, when=0, *args, **kwargs):
+    """PMT for every combination of the grid parameters (ranges, lists or scalars)
+
+    :return: array with one axis per parameter with more than one value, in argument order
+    """
+    (rate, nper, pv, fv), shape = _grid_axes(rate, nper, pv, fv)
+    return npf.pmt(rate=rate, nper=nper, pv=pv, fv=fv, when=int(when)).reshape(shape)
+
+
+def _masked_series(values, matrix, ignore_zeros):
+    """Series (periods x series) with missing values masked: NaN and, with ignore_zeros, 0 (empty TM1 cells)"""
+    series = _series_matrix(values, matrix)
+    missing = ~np.isfinite(series)
+    if ignore_zeros in ("True", "true", "TRUE", "1", 1, True):
+        missing |= series == 0
+    return np.ma.masked_array(series, mask=missing)
+
+
+def _pairwise_moments(series):
+    """Moments of every pair of series over the periods where both have values (pairwise complete, as Excel)
+
+    :return: count, co-moment and the sums of squared deviations of both series per pair (series x series)
+    """
+    present = (~np.ma.getmaskarray(series)).astype(np.float64)
+    data = series.filled(0)
+    count = present.T @ present
+    # sum of series i over the periods shared with series j
+    sums = data.T @ present
+    with np.errstate(divide="ignore", invalid="ignore"):
+        comoment = data.T @ data - sums * sums.T / count
+        squares = (data**2).T @ present - sums**2 / count
+    return count, comoment, squares, squares.T
+
+
+@tm1_tidy
+@tm1_io_matrix
+def covar(values=None, matrix=None, ddof=0, ignore_zeros=False, *args, **kwargs):
+    """Covariance matrix of all series in one call
+
+    :param values: one series
+    :param matrix: source view with one row per period and one column per series (e.g. projects or accounts)
+    :param ddof: 0 for population covariance (as Excel COVAR), 1 for sample covariance
+    :param ignore_zeros: treat 0 as missing. Missing values are excluded pairwise
+    :return: array (series x series)
+    """
+    series = _masked_series(values, matrix, ignore_zeros)
+    if not series.mask.any():
+        return np.atleast_2d(np.cov(series.data, rowvar=False, ddof=int(ddof)))
+    count, comoment, _, _ = _pairwise_moments(series)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(count > int(ddof), comoment / (count - int(ddof)), np.nan)
+
+
+@tm1_tidy
+@tm1_io_matrix
+def correl(values=None, matrix=None, ignore_zeros=False, *args, **kwargs):
+    """Pearson correlation matrix of all series in one call
+
+    :param values: one series
+    :param matrix: source view with one row per period and one column per series (e.g. projects or accounts)
+    :param ignore_zeros: treat 0 as missing. Missing values are excluded pairwise
+    :return: array (series x series)
+    """
+    series = _masked_series(values, matrix, ignore_zeros)
+    if not series.mask.any():
+        return np.atleast_2d(np.corrcoef(series.data, rowvar=False))
+    _, comoment, squares, squares_other = _pairwise_moments(series)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.clip(comoment / np.sqrt(squares * squares_other), -1, 1)
+
+
+def _draw_scenarios(rng, distribution, parameters, scenarios):
+    """Random cash flows (scenarios x periods). parameters has one row per period"""
+    if distribution == "normal":
+        mean, stdev = parameters[:, 0], parameters[:, 1]
+        return rng.normal(mean, stdev, size=(scenarios, len(parameters)))
+    if distribution == "uniform":
+        low, high = parameters[:, 0], parameters[:, 1]
+        return rng.uniform(low, high, size=(scenarios, len(parameters)))
+    if distribution == "triangular":
+        # inverse CDF, so periods without spread (min = max) are allowed
+        low, mode, high = parameters[:, 0], parameters[:, 1], parameters[:, 2]
+        spread = high - low
+        u = rng.random((scenarios, len(parameters)))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mode_quantile = np.where(spread > 0, (mode - low) / spread, 0)
+            return np.where(
+                u < mode_quantile,
+                low + np.sqrt(u * spread * (mode - low)),
+                high - np.sqrt((1 - u) * spread * (high - mode)),
+            )
+    raise ValueError(f"Unknown distribution: '{distribution}'. Use normal, uniform or triangular")
+
+
+def _irr_rows(matrix, guess=0.1, iterations=100, tolerance=1e-10):
+    """IRR of every row with vectorized Newton iterations. Rows without convergence are NaN"""
+    periods = np.arange(matrix.shape[1], dtype=np.float64)
+    rate = np.full(len(matrix), float(guess))
+    converged = np.zeros(len(matrix), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for _ in range(iterations):
+            discount = (1 + rate[:, None]) ** -periods[None, :]
+            value = np.sum(matrix * discount, axis=1)
+            derivative = np.sum(-periods * matrix * discount, axis=1) / (1 + rate)
+            step = value / derivative
+            rate = np.where(converged, rate, rate - step)
+            converged |= np.abs(step) < tolerance
+            if converged.all():
+                break
+    return np.where(converged & (rate > -1), rate, np.nan)
+
+
+@tm1_tidy
+@tm1_io_matrix
+def simulate(
+    matrix,
+    measure="NPV",
+    rate=None,
+    distribution="normal",
+    scenarios=10000,
+    block_size=10000,
+    seed=0,
+    quantiles="0.1,0.5,0.9",
+    *args,
+    **kwargs,
+):
+    """Monte Carlo simulation of NPV or IRR under uncertain cash flows
+
+    Scenarios are drawn with a seeded generator in blocks of block_size scenarios (block_size x periods),
+    so memory does not grow with the number of scenarios.
+
+    :param matrix: distribution parameters, one row per period. normal: mean, stdev. uniform: min, max.
+    triangular: min, mode, max
+    :param measure: NPV or IRR
+    :param rate: discount rate (NPV)
+    :param distribution: normal, uniform or triangular
+    :param scenarios: number of scenarios
+    :param block_size: scenarios per block
+    :param seed: seed of the random generator. Same seed, same result
+    :param quantiles: quantiles of the measure to return, e.g. '0.1,0.5,0.9' for P10/P50/P90
+    :return: one value per quantile
+    """
+    parameters = np.atleast_2d(np.asarray(matrix, dtype=np.float64))
+    measure = str(measure).upper()
+    if measure == "NPV":
+        if rate is None:
+            raise ValueError("'rate' is required for measure NPV")
+        discount = _discount_matrix(np.array([float(rate)]), len(parameters))[0]
+    elif measure != "IRR":
+        raise ValueError(f"Unknown measure: '{measure}'. Use NPV or IRR")
+
+    rng = np.random.default_rng(int(seed))
+    scenarios, block_size = int(scenarios), int(block_size)
+    results = np.empty(scenarios, dtype=np.float64)
+    for start in range(0, scenarios, block_size):
+        block = _draw_scenarios(
+            rng, distribution, parameters, min(block_size, scenarios - start)
+        )
+        results[start:start + len(block)] = block @ discount if measure == "NPV" else _irr_rows(block)
+
+    # scenarios without IRR are left out
+    results = results[np.isfinite(results)]
+    return quantile_rows(results[np.newaxis, :], quantiles)[0]
@@ -0,0 +1,89 @@
+from typing import Dict, List
+
+import numpy as np
+from TM1py import TM1Service
+
+from constants import CONFIG, METHODS
+from utils import CubeCalc, check_single_mode, compute_batch
+
+
+class CubeCalcSession:
+    """ Python API of cubecalc. Connections stay open for all calls until the session is closed
+
+    with CubeCalcSession() as session:
+        npv = session.run("NPV", rate=0.1, values=[-100, 60, 60])
+        irr = session.run("IRR", tm1_source="tm1srv01", cube_source="Py Project Planning", view_source="Project1")
+        results = session.run_batch("IRR", tm1_source="tm1srv01", ..., dimension="Py Project", subset="All Projects")
+
+    Parameters are the same as on the command line, errors are raised instead of logged.
+    """
+
+    def __init__(self, config=CONFIG, tm1_services: Dict[str, TM1Service] = None):
+        """
+        :param config: path to the config.ini. Connections are opened for all instances and closed with the session
+        :param tm1_services: existing connections by instance name. They stay open when the session is closed
+        """
+        self.owns_connections = tm1_services is None
+        self.calculator = CubeCalc(config=config, tm1_services=tm1_services)
+
+    @property
+    def tm1_services(self) -> Dict[str, TM1Service]:
+        return self.calculator.tm1_services
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.owns_connections:
+            self.calculator.logout()
+
+    def run(self, method: str, **parameters):
+        """ Calculate method once, like the single mode.
+        The series is passed as values (and dates) or read from a source view or MDX.
+        The result is written to the target, if one is given
+
+        :return: float or np.ndarray
+        """
+        check_single_mode(parameters)
+        return _as_result(METHODS[method](**parameters, tm1_services=self.tm1_services))
+
+    def run_batch(self, method: str, series: List[List] = None, dates: List[List] = None,
+                  element_parameters: Dict[str, List] = None, compute_workers: int = 1,
+                  **parameters):
+        """ Calculate method for many series.
+
+        With series the calculation runs in memory: one result per series, as array if all results are scalars.
+        Without series the elements of dimension (and subset) are calculated in TM1, like the iterative mode on the
+        command line, and the results are returned by element tuple.
+
+        :param series: value lists, calculated without TM1
+        :param dates: date lists (same shape as series)
+        :param element_parameters: parameters with one value per series
+        :param compute_workers: number of processes
+        :return: np.ndarray or list of results, or dictionary of element tuple and result
+        """
+        if series is not None:
+            results = compute_batch(method, parameters, series, dates or [[] for _ in series], compute_workers,
+                                    element_parameters)
+            results = [_as_result(result) for result in results]
+            if all(isinstance(result, float) for result in results):
+                return np.array(results, dtype=np.float64)
+            return results
+
+        if "dimension" not in parameters:
+            raise ValueError("run_batch requires series or a dimension")
+        if compute_workers > 1:
+            parameters["compute_workers"] = compute_workers
+        results = self.calculator.execute_iterative_mode(method, dict(parameters))
+        return {element_tuple: _as_result(result) for element_tuple, result in results.items()}
+
+
+def _as_result(result):
+    if isinstance(result, (list, tuple, np.ndarray)):
+        return np.asarray(result, dtype=np.float64)
+    if isinstance(result, (int, float, np.number)):
+        return float(result)
+    return result
@@ -0,0 +1,123 @@
+import math
+
+import numpy as np
+
+
+def hash64(values: np.ndarray) -> np.ndarray:
+    """ 64 bit hashes of float values (splitmix64 finalizer on the IEEE bits). Equal numbers get equal hashes """
+    values = np.asarray(values, dtype=np.float64) + 0.0  # -0.0 becomes 0.0
+    z = values.view(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class HyperLogLog:
+    """ Approximate distinct count with 2 ** precision one byte registers.
+
+    The relative standard error is about 1.04 / sqrt(2 ** precision), e.g. 0.81% for precision 14 (16 KB).
+    Sketches with the same precision are merged by taking the maximum of the registers.
+    """
+
+    def __init__(self, precision: int = 14):
+        if not 4 <= precision <= 18:
+            raise ValueError(f"precision must be between 4 and 18. Got: {precision}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values):
+        hashes = hash64(values)
+        if not len(hashes):
+            return
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << width) - 1)
+        # rank = position of the leftmost 1 bit in the remaining bits. np.log2 may round up close to powers of 2
+        bit_length = np.zeros(len(remainder), dtype=np.int64)
+        nonzero = remainder > 0
+        estimate = np.floor(np.log2(remainder[nonzero].astype(np.float64))).astype(np.int64)
+        estimate[(np.uint64(1) << estimate.astype(np.uint64)) > remainder[nonzero]] -= 1
+        bit_length[nonzero] = estimate + 1
+        rank = (width - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError("Only sketches with the same precision can be merged")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> float:
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # linear counting for small cardinalities
+        if estimate <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return float(estimate)
+
+
+class KllSketch:
+    """ Approximate quantiles with bounded memory (KLL sketch).
+
+    Items are kept in levels of compactors. A full level is sorted and every second item is promoted to the next
+    level with twice the weight. Memory is about 3 * k items. The rank error is roughly 1.7 / k, e.g. 0.85%
+    (of the number of values) for k 200. Sketches with the same k are merged level by level.
+    """
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        if k < 8:
+            raise ValueError(f"k must be at least 8. Got: {k}")
+        self.k = k
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self.rng = np.random.default_rng(seed)
+
+    def capacity(self, level: int) -> int:
+        return max(2, int(math.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.levels[0] = np.concatenate([self.levels[0], values[np.isfinite(values)]])
+        self.compress()
+
+    def merge(self, other: "KllSketch") -> "KllSketch":
+        if other.k != self.k:
+            raise ValueError("Only sketches with the same k can be merged")
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0, dtype=np.float64))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.compress()
+        return self
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                items = np.sort(items)
+                # an odd item stays on its level, so no weight is lost
+                kept = items[len(items) - len(items) % 2:]
+                promoted = items[self.rng.integers(2):len(items) - len(items) % 2:2]
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                # capacities of all levels shrink when a level is added
+                level = 0
+                continue
+            level += 1
+
+    def count(self) -> int:
+        return int(sum(len(items) << level for level, items in enumerate(self.levels)))
+
+    def quantiles(self, quantiles) -> np.ndarray:
+        items = np.concatenate(self.levels)
+        if not len(items):
+            raise ValueError("Quantiles require at least one value")
+        weights = np.concatenate([np.full(len(items), 1 << level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(quantiles, dtype=np.float64) * cumulative[-1] - 1e-9)
+        return items[order][np.minimum(positions, len(items) - 1)]
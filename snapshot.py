@@ -0,0 +1,100 @@
+import json
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+MANIFEST = "snapshot.json"
+
+
+class SnapshotWriter:
+    """ Capture the inputs of a batch run, so the calculation can be replayed without TM1.
+
+    DIR/snapshot.json       method, parameters, dimensions, hierarchies
+    DIR/elements.npy        element tuples (elements x dimensions)
+    DIR/offsets.npy         start of every element in values and ordinals (elements + 1)
+    DIR/values.npy          values of all elements, one after another (empty cells as NaN)
+    DIR/ordinals.npy        row dates as ordinals (same shape as values)
+    DIR/parameters/<name>.npy   parameters bound to a parameter cube (one value per element)
+
+    Only the elements appended before close are saved, e.g. the elements read before a deadline stopped the run.
+    The manifest is written last, so an incomplete snapshot of a crashed run can not be replayed.
+    """
+
+    def __init__(self, directory, method: str, parameters: Dict, dimensions: List[str], hierarchies: List[str],
+                 element_tuples: List[Tuple[str, ...]], element_parameters: Dict[str, List] = None):
+        self.directory = directory
+        self.manifest = {
+            "method": method,
+            "parameters": parameters,
+            "dimensions": dimensions,
+            "hierarchies": hierarchies}
+        self.element_tuples = element_tuples
+        self.element_parameters = element_parameters or dict()
+        self.lengths, self.values, self.ordinals = [], [], []
+        os.makedirs(os.path.join(directory, "parameters"), exist_ok=True)
+
+    def append(self, series: List[List], dates: List[List]):
+        """ add the series and dates of the next elements (in the order of the element tuples) """
+        for element_values, element_dates in zip(series, dates):
+            self.lengths.append(len(element_values))
+            self.values.append(np.array(
+                [np.nan if value is None else value for value in element_values], dtype=np.float64))
+            self.ordinals.append(np.array([element_date.toordinal() for element_date in element_dates],
+                                          dtype=np.int64))
+
+    def close(self):
+        elements = len(self.lengths)
+        np.save(os.path.join(self.directory, "elements.npy"),
+                np.array(self.element_tuples[:elements], dtype=str).reshape(elements, len(self.manifest["dimensions"])))
+        for name, values in self.element_parameters.items():
+            np.save(os.path.join(self.directory, "parameters", name + ".npy"), _to_array(values[:elements]))
+        offsets = np.zeros(elements + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=offsets[1:])
+        np.save(os.path.join(self.directory, "offsets.npy"), offsets)
+        np.save(os.path.join(self.directory, "values.npy"),
+                np.concatenate(self.values) if self.values else np.empty(0, dtype=np.float64))
+        np.save(os.path.join(self.directory, "ordinals.npy"),
+                np.concatenate(self.ordinals) if self.ordinals else np.empty(0, dtype=np.int64))
+        with open(os.path.join(self.directory, MANIFEST), "w") as file:
+            # parameters of jobs files may be dates or numbers. Replays get them as strings, like command line arguments
+            json.dump(self.manifest, file, indent=2, default=str)
+
+
+class Snapshot:
+    """ Snapshot of a batch run. Values, dates and bound parameters are memory-mapped, not loaded """
+
+    def __init__(self, directory):
+        path = os.path.join(directory, MANIFEST)
+        if not os.path.isfile(path):
+            raise ValueError(f"'{directory}' does not contain a complete snapshot")
+        with open(path, "r") as file:
+            manifest = json.load(file)
+        self.method: str = manifest["method"]
+        self.parameters: Dict = manifest["parameters"]
+        self.dimensions: List[str] = manifest["dimensions"]
+        self.hierarchies: List[str] = manifest["hierarchies"]
+        self.element_tuples = [tuple(row) for row in np.load(os.path.join(directory, "elements.npy")).tolist()]
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        self.values = np.load(os.path.join(directory, "values.npy"), mmap_mode="r")
+        self.ordinals = np.load(os.path.join(directory, "ordinals.npy"), mmap_mode="r")
+        parameters_directory = os.path.join(directory, "parameters")
+        self.element_parameters = {
+            file_name[:-len(".npy")]: np.load(os.path.join(parameters_directory, file_name), mmap_mode="r")
+            for file_name
+            in sorted(os.listdir(parameters_directory))
+            if file_name.endswith(".npy")}
+
+    def series(self) -> List[np.ndarray]:
+        """ values per element as views on the memory-mapped file """
+        return [self.values[start:stop] for start, stop in zip(self.offsets[:-1], self.offsets[1:])]
+
+    def dates(self) -> List[np.ndarray]:
+        """ date ordinals per element as views on the memory-mapped file. XNPV and XIRR accept ordinals """
+        return [self.ordinals[start:stop] for start, stop in zip(self.offsets[:-1], self.offsets[1:])]
+
+
+def _to_array(values) -> np.ndarray:
+    if any(isinstance(value, str) for value in values):
+        return np.array(values, dtype=str)
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
@@ -0,0 +1,156 @@
+import contextlib
+import functools
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List
+
+import cache
+
+# measure elements of the stats cube
+STATS_METRICS = (
+    "Success",
+    "Failures",
+    "Elements",
+    "Elements per Second",
+    "Total Seconds",
+    "Read Seconds",
+    "Compute Seconds",
+    "Write Seconds",
+    "REST Calls",
+    "Payload Bytes Sent",
+    "Payload Bytes Received",
+    "Cache Hits",
+    "Cache Misses",
+    "Cache Hit Rate")
+# request methods of the TM1py RestService
+REQUEST_METHODS = ("GET", "POST", "PATCH", "PUT", "DELETE")
+
+
+class RunStats:
+    """ Metrics of one run: elements, phase durations, REST calls, bytes and cache hits.
+
+    REST calls and payload sizes are counted on the request methods of the TM1py connections, cache hits with the
+    counters of the read cache. Both are shared by all runs of the process, so runs that overlap (concurrent jobs)
+    count each other's requests. Payloads are counted uncompressed, as sent and received by TM1py
+    """
+
+    def __init__(self, tm1_services: Dict):
+        self.tm1_services = tm1_services
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.elements = 0
+        self.failures = 0
+        self.calls = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.phases = Counter()
+        self.cache_statistics = Counter(cache.statistics)
+        for tm1 in tm1_services.values():
+            _attach(tm1.connection, self.observe_response)
+
+    def observe_response(self, response):
+        # asynchronous requests may return an id instead of a response
+        if not hasattr(response, "request"):
+            return
+        body = response.request.body or b""
+        with self.lock:
+            self.calls += 1
+            self.bytes_sent += len(body.encode("utf-8") if isinstance(body, str) else body)
+            self.bytes_received += len(response.content or b"")
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """ add the duration of the block to the phase. Phases of the pipeline stages overlap """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] += time.perf_counter() - started
+
+    def stop(self, elements: int, success: bool):
+        """ detach from the sessions and freeze the metrics """
+        for tm1 in self.tm1_services.values():
+            _detach(tm1.connection, self.observe_response)
+        self.seconds = time.perf_counter() - self.started
+        self.elements = elements
+        self.failures = 0 if success else 1
+        self.cache_statistics = Counter(cache.statistics) - self.cache_statistics
+
+    def metrics(self) -> Dict[str, float]:
+        hits, misses = self.cache_statistics["hits"], self.cache_statistics["misses"]
+        return {
+            "Success": float(not self.failures),
+            "Failures": float(self.failures),
+            "Elements": float(self.elements),
+            "Elements per Second": self.elements / self.seconds if self.seconds else 0.0,
+            "Total Seconds": self.seconds,
+            "Read Seconds": self.phases["read"],
+            "Compute Seconds": self.phases["compute"],
+            "Write Seconds": self.phases["write"],
+            "REST Calls": float(self.calls),
+            "Payload Bytes Sent": float(self.bytes_sent),
+            "Payload Bytes Received": float(self.bytes_received),
+            "Cache Hits": float(hits),
+            "Cache Misses": float(misses),
+            "Cache Hit Rate": hits / (hits + misses) if hits + misses else 0.0}
+
+
+def phase(stats: RunStats, name: str):
+    """ phase of the run or a no-op, if telemetry is off """
+    return stats.phase(name) if stats else contextlib.nullcontext()
+
+
+def write_stats(tm1, cube: str, elements, stats: RunStats):
+    """ Write the metrics of a run with one request
+
+    :param cube: stats cube. The last dimension holds the STATS_METRICS
+    :param elements: one element for each of the other dimensions, e.g. (run date, job)
+    """
+    tm1.cells.write_values(cube, {(*elements, metric): value for metric, value in stats.metrics().items()})
+    logging.info(f"Wrote {len(STATS_METRICS)} metrics to '{cube}'")
+
+
+# observers and original request methods by connection
+_observed_connections: Dict[int, tuple] = dict()
+_observed_connections_lock = threading.Lock()
+
+
+def _attach(connection, observer: Callable):
+    """ call observer with the response of every request of the connection """
+    with _observed_connections_lock:
+        if id(connection) not in _observed_connections:
+            originals = {name: getattr(connection, name) for name in REQUEST_METHODS}
+            observers = []
+            for name, request_method in originals.items():
+                setattr(connection, name, _observed(request_method, observers))
+            _observed_connections[id(connection)] = (originals, observers)
+        _observed_connections[id(connection)][1].append(observer)
+
+
+def _detach(connection, observer: Callable):
+    """ stop observing. The original request methods are restored when the last observer is detached """
+    with _observed_connections_lock:
+        if id(connection) not in _observed_connections:
+            return
+        originals, observers = _observed_connections[id(connection)]
+        if observer in observers:
+            observers.remove(observer)
+        if not observers:
+            for name, request_method in originals.items():
+                setattr(connection, name, request_method)
+            del _observed_connections[id(connection)]
+
+
+def _observed(request_method, observers: List[Callable]):
+    @functools.wraps(request_method)
+    def wrapper(*args, **kwargs):
+        response = request_method(*args, **kwargs)
+        for observer in list(observers):
+            observer(response)
+        return response
+
+    return wrapper
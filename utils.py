@@ -1,45 +1,153 @@
+import atexit
 import configparser
+import itertools
 import logging
 import os
+import multiprocessing
+import queue
 import re
 import sys
+import threading
+import time
 from base64 import b64decode
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
 
-from TM1py import TM1Service, AnonymousSubset, MDXView
-from TM1py.Utils import case_and_space_insensitive_equals
+import numpy as np
+from mdxpy import MdxBuilder, MdxHierarchySet, MdxTuple, Member
+from scipy import sparse
+from TM1py import TM1Service, AnonymousSubset, Element, MDXView, NativeView
+from TM1py.Utils import case_and_space_insensitive_equals, CaseAndSpaceInsensitiveTuplesDict
 
-from constants import LOGFILE, APP_NAME, CONFIG, METHODS
+from constants import LOGFILE, APP_NAME, CONFIG, METHODS, DIMENSION_SEPARATOR, BINDING_SUFFIX, VECTORIZED_METHODS, \
+    ROW_WISE_METHODS, \
+    CHUNK_INITIAL_SIZE, CHUNK_TARGET_SECONDS, CHUNK_MAX_CELLS, PIPELINE_QUEUE_SIZE, DEFAULT_CONNECTION_POOL_SIZE, \
+    ITERATIVE_MODE_PARAMETERS
+from methods import rows_and_values_to_series, cell_values, write_cell_values, write_tolerance, date_ordinals
+from cache import read_rows_and_values
+from snapshot import Snapshot, SnapshotWriter
+from telemetry import RunStats, phase, write_stats
+from checkpoint import Checkpoint, DeadlineReached
+
+# queue of the log listener, shared with process pool workers. None until logging is configured
+_log_queue = None
+
+
+def configure_logging(level=logging.INFO) -> QueueListener:
+    """ Log to the log file and stdout through a queue.
+    Records are written by a background thread, so a slow file system or a blocked stdout (e.g. captured by TI)
+    does not slow down the calculation. The listener is stopped and the queue flushed at exit
+
+    :param level: INFO logs summaries per run. DEBUG also logs the result of every element
+    :return: the started listener
+    """
+    global _log_queue
+    formatter = logging.Formatter("%(asctime)s - " + APP_NAME + " - %(levelname)s - %(message)s")
+    handlers = [logging.FileHandler(LOGFILE), logging.StreamHandler(sys.stdout)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    # a process queue, so the records of process pool workers reach the same listener
+    _log_queue = multiprocessing.Queue()
+    listener = QueueListener(_log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger()
+    logger.addHandler(QueueHandler(_log_queue))
+    logger.setLevel(level)
+    return listener
+
+
+def process_pool(compute_workers: int) -> ProcessPoolExecutor:
+    """ Process pool whose workers log through the queue of configure_logging """
+    return ProcessPoolExecutor(max_workers=compute_workers, initializer=_configure_worker_logging,
+                               initargs=(_log_queue, logging.getLogger().level))
+
+
+def _configure_worker_logging(log_queue, level):
+    """ Runs in every worker process. Forked workers inherit a handler whose queue has no listener in the worker """
+    logger = logging.getLogger()
+    if log_queue is not None:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(level)
+
+
+def log_results(method, element_tuples, results):
+    """ log the result of every element at DEBUG level. Messages are only formatted if DEBUG is enabled """
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return
+    for element_tuple, result in zip(element_tuples, results):
+        logging.debug("Successfully calculated %s with result: %s for title element '%s'",
+                      method, result, ", ".join(element_tuple))
+
+
+def check_single_mode(parameters):
+    """ raise ValueError for parameters that only apply to the iterative mode """
+    for name in ITERATIVE_MODE_PARAMETERS:
+        if name in parameters:
+            raise ValueError(f"'{name}' requires the iterative mode. Pass a 'dimension'")
+
+
+def uses_batch_path(parameters) -> bool:
+    """ True if a run over one title dimension takes the batch path instead of altering the views per element """
+    return ("compute_workers" in parameters
+            or "chunk_size" in parameters
+            or "snapshot_out" in parameters
+            or any(key.endswith(BINDING_SUFFIX) for key in parameters))
+
+
+def execution_mode(parameters) -> str:
+    """ Mode a run takes in CubeCalc.run: single, aggregated, iterative, batch or pipeline """
+    if "dimension" not in parameters:
+        return "single"
+    if DIMENSION_SEPARATOR not in parameters["dimension"]:
+        if parameters.get("aggregate", False) in ("True", "true", "TRUE", "1", 1):
+            return "aggregated"
+        if not uses_batch_path(parameters):
+            return "iterative"
+    # batch runs with a deadline are checked between chunks
+    if "chunk_size" in parameters or "deadline" in parameters:
+        return "pipeline"
+    return "batch"
 
-def configure_logging():
-    logging.basicConfig(
-        filename=LOGFILE,
-        format="%(asctime)s - " + APP_NAME + " - %(levelname)s - %(message)s",
-        level=logging.INFO,
-    )
-    # also log to stdout
-    logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
 
 class CubeCalc:
+    # per thread, so concurrent jobs keep their telemetry apart
+    _local = threading.local()
 
-    def __init__(self):
+    def __init__(self, config=CONFIG, tm1_services: Dict[str, TM1Service] = None):
+        """
+        :param config: path to the config.ini with one section per instance
+        :param tm1_services: existing connections by instance name. config is not read, if given
+        """
         self.tm1_services: Dict[str, TM1Service] = dict()
-        self.setup()
+        # actual dimension and hierarchy names per instance. Shared by all runs of this calculator
+        self.actual_names: Dict[Tuple[int, str, str], Tuple[str, str]] = dict()
+        if tm1_services is not None:
+            self.tm1_services.update(tm1_services)
+        else:
+            self.setup(config)
 
-    def setup(self):
+    def setup(self, config_path=CONFIG):
         """ Fill Dictionary with TM1ServerName (as in config.ini) : Instantiated TM1Service
 
         :return: Dictionary server_names and TM1py.TM1Service instances pairs
         """
-        if not os.path.isfile(CONFIG):
-            raise ValueError("{config} does not exist.".format(config=CONFIG))
+        if not os.path.isfile(config_path):
+            raise ValueError("{config} does not exist.".format(config=config_path))
         config = configparser.ConfigParser()
-        config.read(CONFIG)
+        config.read(config_path)
         # build tm1_services dictionary
         for tm1_server_name, params in config.items():
             # handle default values from configparser
             if tm1_server_name != config.default_section:
                 try:
+                    params = dict(params)
+                    params.setdefault("connection_pool_size", str(DEFAULT_CONNECTION_POOL_SIZE))
                     self.tm1_services[tm1_server_name] = TM1Service(**params, session_context=APP_NAME)
                 # Instance not running, Firewall or wrong connection parameters
                 except Exception as e:
@@ -53,25 +161,55 @@ class CubeCalc:
             tm1.logout()
 
     def execute(self, method, parameters):
-        """
+        """ run the method once and logout afterwards
 
         :param method:
         :param parameters:
         :return:
         """
+        try:
+            return self.run(method, parameters)
+        finally:
+            self.logout()
+
+    @property
+    def stats(self) -> RunStats:
+        """ telemetry of the run in the current thread. None if telemetry is off """
+        return getattr(self._local, "stats", None)
+
+    def run(self, method, parameters):
+        """ run the method without logging out, so connections can be reused for further runs
+
+        :param method:
+        :param parameters:
+        :return: success
+        """
+        # telemetry, written to the stats cube at the end of the run
+        stats_cube = parameters.pop("stats_cube", None)
+        tm1_stats = parameters.pop("tm1_stats", parameters.get("tm1_target"))
+        stats_elements = parameters.pop("stats_elements", method).split(DIMENSION_SEPARATOR)
+        self._local.stats = RunStats(self.tm1_services) if stats_cube else None
+        elements, success = 0, False
         try:
             # single mode
             if "dimension" not in parameters:
                 logging.info("Running in single mode")
+                check_single_mode(parameters)
                 result = METHODS[method](**parameters, tm1_services=self.tm1_services)
                 logging.info(f"Successfully calculated {method} with result: {result} from parameters: {parameters}")
+                elements, success = 1, True
                 return True
 
             # iterative mode
-            self.execute_iterative_mode(method, parameters)
+            elements = len(self.execute_iterative_mode(method, parameters))
             logging.info(f"Successfully calculated {method} in iterative mode with parameters: {parameters}")
+            success = True
             return True
 
+        except DeadlineReached as ex:
+            logging.warning(str(ex))
+            return False
+
         except Exception as ex:
             message = "Failed calculating {method} with parameters {parameters}. Error: {error}".format(
                 method=method,
@@ -79,12 +217,30 @@ class CubeCalc:
                 error=str(ex))
             logging.exception(message)
             return False
+
         finally:
-            self.logout()
+            stats, self._local.stats = self.stats, None
+            if stats:
+                stats.stop(elements, success)
+                try:
+                    write_stats(self.tm1_services[tm1_stats], stats_cube, stats_elements, stats)
+                except Exception as ex:
+                    logging.exception(f"Failed writing metrics to '{stats_cube}'. Error: {str(ex)}")
 
-    def execute_iterative_mode(self, method, parameters):
+    def execute_iterative_mode(self, method, parameters) -> Dict[Tuple[str, ...], object]:
+        """ :return: result per element tuple """
         dimension = parameters.get("dimension")
         hierarchy = parameters.get("hierarchy", dimension)
+        checkpoint = Checkpoint.from_parameters(method, parameters)
+
+        if DIMENSION_SEPARATOR in dimension:
+            return self.execute_multi_dimensional_mode(method, parameters, checkpoint)
+
+        if parameters.pop("aggregate", False) in ("True", "true", "TRUE", "1", 1):
+            if checkpoint:
+                raise ValueError("'deadline', 'resume' and 'checkpoint' are not supported with 'aggregate'. "
+                                 "Aggregated runs read all leaves in one request")
+            return self.execute_aggregated_mode(method, parameters)
 
         tm1_source_name = parameters['tm1_source']
         tm1_target_name = parameters['tm1_target']
@@ -111,13 +267,21 @@ class CubeCalc:
                 dimension_name=dimension,
                 hierarchy_name=hierarchy)
 
-        # only pass tidy in run for last element
+        # views are deleted after the last element
         if "tidy" in parameters:
             tidy = parameters.pop("tidy")
         else:
             tidy = False
 
-        if not tidy:
+        if uses_batch_path(parameters):
+            compute_workers = int(parameters.pop("compute_workers", 1))
+            chunk_size = parameters.pop("chunk_size", None)
+            return self.execute_batch_mode(method, parameters, [dimension], [hierarchy],
+                                           [(element,) for element in element_names], tidy, compute_workers,
+                                           chunk_size, checkpoint)
+
+        tidy_views = tidy in ("True", "true", "TRUE", "1", 1)
+        if not tidy_views:
             original_view_source = tm1_source.views.get(
                 cube_name=cube_source,
                 view_name=view_source,
@@ -127,20 +291,515 @@ class CubeCalc:
                 view_name=view_target,
                 private=False)
 
-        for element in element_names:
-            self.alter_view(tm1_source=tm1_source_name, tm1_target=tm1_target_name, cube_source=cube_source,
-                            view_source=view_source, cube_target=cube_target, view_target=view_target,
-                            dimension=dimension, hierarchy=hierarchy, element=element)
-            result = METHODS[method](
-                **parameters,
-                tm1_services=self.tm1_services,
-                tidy=tidy if element == element_names[-1] else False)
-            logging.info(f"Successfully calculated {method} with result: {result} for title element '{element}'")
+        results = dict()
+        pending = element_names
+        if checkpoint:
+            results = {(element,): checkpoint.completed[(element,)]
+                       for element
+                       in element_names
+                       if (element,) in checkpoint.completed}
+            pending = [element for element in element_names if (element,) not in results]
+        try:
+            for element in pending:
+                if checkpoint and checkpoint.expired():
+                    raise DeadlineReached(
+                        f"Deadline reached after {len(results)} of {len(element_names)} elements. Rerun with "
+                        f"--resume true to continue from checkpoint '{checkpoint.path}'")
+                try:
+                    self.alter_view(tm1_source=tm1_source_name, tm1_target=tm1_target_name, cube_source=cube_source,
+                                    view_source=view_source, cube_target=cube_target, view_target=view_target,
+                                    dimension=dimension, hierarchy=hierarchy, element=element)
+                    result = METHODS[method](**parameters, tm1_services=self.tm1_services)
+                except Exception:
+                    logging.error(f"Failed calculating {method} for title element '{element}'")
+                    raise
+                log_results(method, [(element,)], [result])
+                results[(element,)] = result
+                if checkpoint:
+                    checkpoint.add([(element,)], [result])
+        finally:
+            if checkpoint:
+                checkpoint.save()
+            # delete or restore the views after the last pending element, which is not always the last element
+            # (resumed runs, deadline)
+            if tidy_views:
+                tm1_source.views.delete(cube_source, view_source, private=False)
+                tm1_target.views.delete(cube_target, view_target, private=False)
+            else:
+                tm1_source.views.update_or_create(original_view_source, False)
+                tm1_target.views.update_or_create(original_view_target, False)
+        logging.info(f"Calculated {method} for {len(element_names)} elements of '{dimension}'")
+
+        if checkpoint:
+            checkpoint.remove()
+        return results
+
+    def execute_multi_dimensional_mode(self, method, parameters, checkpoint: Checkpoint = None):
+        """ Iterate over the cross product of several title dimensions.
+        `dimension`, `hierarchy` and `subset` hold one entry per dimension, separated by DIMENSION_SEPARATOR.
+        An empty subset entry stands for all leaf elements of the hierarchy.
+        """
+        dimensions = parameters["dimension"].split(DIMENSION_SEPARATOR)
+        hierarchies = parameters.get("hierarchy", parameters["dimension"]).split(DIMENSION_SEPARATOR)
+        if "subset" in parameters:
+            subsets = parameters.pop("subset").split(DIMENSION_SEPARATOR)
+        else:
+            subsets = [""] * len(dimensions)
+        if not len(dimensions) == len(hierarchies) == len(subsets):
+            raise ValueError("'dimension', 'hierarchy' and 'subset' must have the same number of entries")
+
+        tidy = parameters.pop("tidy", False)
+        compute_workers = int(parameters.pop("compute_workers", 1))
+        chunk_size = parameters.pop("chunk_size", None)
+
+        tm1_source: TM1Service = self.tm1_services[parameters['tm1_source']]
+        view_source = None
+        if "view_source" in parameters:
+            view_source = tm1_source.views.get(parameters["cube_source"], parameters["view_source"], private=False)
+        element_tuples = self.resolve_element_tuples(tm1_source, view_source, dimensions, hierarchies, subsets)
+        logging.info(f"Resolved {len(element_tuples)} non empty combinations of {dimensions}")
+
+        return self.execute_batch_mode(method, parameters, dimensions, hierarchies, element_tuples, tidy,
+                                       compute_workers, chunk_size, checkpoint)
+
+    def execute_aggregated_mode(self, method, parameters):
+        """ Calculate method for leaves and consolidations of the title dimension from one leaf level read.
+        Series of consolidations are aggregated locally through a sparse matrix (nodes x leaves) of the
+        hierarchy weights, so TM1 never has to consolidate per node.
+        Without subset all numeric and consolidated elements of the hierarchy are calculated.
+        """
+        dimension = parameters["dimension"]
+        hierarchy = parameters.get("hierarchy", dimension)
+        tidy = parameters.pop("tidy", False)
+        compute_workers = int(parameters.pop("compute_workers", 1))
+
+        tm1_source: TM1Service = self.tm1_services[parameters['tm1_source']]
+        tm1_target: TM1Service = self.tm1_services[parameters['tm1_target']]
+
+        hierarchy_object = tm1_source.hierarchies.get(dimension, hierarchy)
+        if "subset" in parameters:
+            nodes = tm1_source.subsets.get_element_names(dimension, hierarchy, parameters.pop("subset"), private=False)
+        else:
+            nodes = [element.name for element in hierarchy_object if element.element_type != Element.Types.STRING]
+        matrix, leaves = aggregation_matrix(hierarchy_object.edges, nodes)
+        logging.info(f"Aggregating {len(nodes)} elements from {len(leaves)} leaves of '{dimension}'")
+
+        view_source = tm1_source.views.get(parameters["cube_source"], parameters["view_source"], private=False)
+        view_target = tm1_target.views.get(parameters["cube_target"], parameters["view_target"], private=False)
+        source_titles = [self.resolve_title(tm1_source, view_source, dimension, hierarchy)]
+        target_titles = [self.resolve_title(tm1_target, view_target, dimension, hierarchy)]
+
+        with phase(self.stats, "read"):
+            leaf_series, leaf_dates = self.read_chunk(tm1_source, view_source, source_titles,
+                                                      [(leaf,) for leaf in leaves], parameters["tm1_source"],
+                                                      parameters.get("cache_dir"))
+        # leaves without data in some periods are aligned on the union of all periods
+        dates = sorted(set(element_date for element_dates in leaf_dates for element_date in element_dates))
+        positions = {element_date: position for position, element_date in enumerate(dates)}
+        leaf_matrix = np.zeros((len(leaves), len(dates)), dtype=np.float64)
+        for row, (element_values, element_dates) in enumerate(zip(leaf_series, leaf_dates)):
+            leaf_matrix[row, [positions[element_date] for element_date in element_dates]] = [
+                value or 0 for value in element_values]
+
+        node_series = matrix @ leaf_matrix
+        if "snapshot_out" in parameters:
+            snapshot = SnapshotWriter(parameters.pop("snapshot_out"), method, dict(parameters), [dimension],
+                                      [hierarchy], [(node,) for node in nodes])
+            snapshot.append(node_series, [dates] * len(nodes))
+            snapshot.close()
+        with phase(self.stats, "compute"):
+            results = compute_batch(method, parameters, list(node_series), [dates] * len(nodes), compute_workers)
+
+        element_tuples = [(node,) for node in nodes]
+        with phase(self.stats, "write"):
+            suppressed = self.write_chunk(tm1_target, view_target, target_titles, element_tuples, results,
+                                          self.cells_per_element(tm1_target, view_target, target_titles,
+                                                                 element_tuples),
+                                          write_tolerance(parameters))
+        if suppressed:
+            logging.info(f"Suppressed {suppressed} unchanged writes")
+        log_results(method, element_tuples, results)
+        logging.info(f"Calculated {method} for {len(nodes)} elements of '{dimension}'")
+
+        if tidy in ("True", "true", "TRUE", "1", 1):
+            tm1_source.views.delete(view_source.cube, view_source.name, private=False)
+            tm1_target.views.delete(view_target.cube, view_target.name, private=False)
+        return dict(zip(element_tuples, results))
 
-        # restore original source_view, target_view
-        if not tidy:
-            tm1_source.views.update_or_create(original_view_source, False)
-            tm1_target.views.update_or_create(original_view_target, False)
+    def resolve_element_tuples(self, tm1, view, dimensions, hierarchies, subsets) -> List[Tuple[str, ...]]:
+        """ Cross product of the subsets.
+        For native source views, combinations without data in the view are skipped through one NON EMPTY query.
+        """
+        if not isinstance(view, NativeView):
+            logging.info("NON EMPTY resolution requires a native source view. Using the full cross product")
+            element_names = [
+                tm1.subsets.get_element_names(dimension, hierarchy, subset, private=False)
+                if subset
+                else tm1.elements.get_leaf_element_names(dimension_name=dimension, hierarchy_name=hierarchy)
+                for dimension, hierarchy, subset
+                in zip(dimensions, hierarchies, subsets)]
+            return list(itertools.product(*element_names))
+
+        query = MdxBuilder.from_cube(view.cube).rows_non_empty()
+        for dimension, hierarchy, subset in zip(dimensions, hierarchies, subsets):
+            query.add_hierarchy_set_to_row_axis(
+                MdxHierarchySet.tm1_subset_to_set(dimension, hierarchy, subset)
+                if subset
+                else MdxHierarchySet.all_leaves(dimension, hierarchy))
+        # the data region of the source view goes on the columns
+        for axis_selection in view.columns + view.rows:
+            query.add_hierarchy_set_to_column_axis(self.axis_selection_to_set(axis_selection))
+        for title in view.titles:
+            if not any(case_and_space_insensitive_equals(title.dimension_name, dimension)
+                       for dimension
+                       in dimensions):
+                query.add_member_to_where(Member.of(title.dimension_name, title.selected))
+
+        rows_and_values = tm1.cells.execute_mdx_rows_and_values(mdx=query.to_mdx(), element_unique_names=False)
+        return [tuple(row) for row in rows_and_values.keys()]
+
+    @staticmethod
+    def axis_selection_to_set(axis_selection) -> MdxHierarchySet:
+        subset = axis_selection.subset
+        if isinstance(subset, AnonymousSubset):
+            if subset.expression is not None:
+                return MdxHierarchySet.from_str(
+                    dimension=subset.dimension_name,
+                    hierarchy=subset.hierarchy_name,
+                    mdx=subset.expression)
+            return MdxHierarchySet.members(
+                [Member.of(subset.dimension_name, element) for element in subset.elements])
+        return MdxHierarchySet.tm1_subset_to_set(
+            dimension=axis_selection.dimension_name,
+            hierarchy=axis_selection.hierarchy_name,
+            subset=subset.name)
+
+    def execute_batch_mode(self, method, parameters, dimensions, hierarchies, element_tuples, tidy,
+                           compute_workers, chunk_size=None, checkpoint: Checkpoint = None):
+        """ Read all elements first, compute them in one batch and write the results afterwards.
+        Titles are substituted on local copies of the views, so the views on the server are never altered.
+
+        :param dimensions: title dimensions
+        :param hierarchies: title hierarchies (same length as dimensions)
+        :param element_tuples: one element per title dimension for every calculation
+        :param compute_workers: number of processes for the calculation. 1 computes in the main process
+        :param chunk_size: number of elements per chunk or 'auto'. Processes the elements in a pipeline of chunks
+        :param checkpoint: skips completed elements and stops at the deadline
+        :return: result per element tuple
+        """
+        snapshot_out = parameters.pop("snapshot_out", None)
+        completed = dict()
+        if checkpoint:
+            completed = {element_tuple: checkpoint.completed[element_tuple]
+                         for element_tuple
+                         in element_tuples
+                         if element_tuple in checkpoint.completed}
+            element_tuples = checkpoint.pending(element_tuples)
+            if chunk_size is None and checkpoint.deadline is not None:
+                # the deadline is checked between chunks
+                chunk_size = "auto"
+        tm1_source: TM1Service = self.tm1_services[parameters['tm1_source']]
+        tm1_target: TM1Service = self.tm1_services[parameters['tm1_target']]
+
+        # parameters bound to a parameter cube, e.g. rate_from: "Py Project Params:Rate"
+        bindings = {key[:-len(BINDING_SUFFIX)]: parameters.pop(key)
+                    for key
+                    in list(parameters)
+                    if key.endswith(BINDING_SUFFIX)}
+        element_parameters = read_bound_parameters(tm1_source, dimensions, hierarchies, element_tuples, bindings)
+        snapshot = None
+        if snapshot_out:
+            snapshot = SnapshotWriter(snapshot_out, method, dict(parameters), dimensions, hierarchies, element_tuples,
+                                      element_parameters)
+
+        view_source = None
+        if "view_source" in parameters:
+            view_source = tm1_source.views.get(parameters["cube_source"], parameters["view_source"], private=False)
+        view_target = tm1_target.views.get(parameters["cube_target"], parameters["view_target"], private=False)
+        source_titles = [self.resolve_title(tm1_source, view_source, dimension, hierarchy)
+                         for dimension, hierarchy
+                         in zip(dimensions, hierarchies)]
+        target_titles = [self.resolve_title(tm1_target, view_target, dimension, hierarchy)
+                         for dimension, hierarchy
+                         in zip(dimensions, hierarchies)]
+
+        try:
+            if chunk_size is not None:
+                results = self.execute_pipeline(method, parameters, tm1_source, tm1_target, view_source, view_target,
+                                                source_titles, target_titles, element_tuples, element_parameters,
+                                                compute_workers, ChunkSizer(chunk_size), snapshot, checkpoint)
+            else:
+                results = self.execute_batch(method, parameters, tm1_source, tm1_target, view_source, view_target,
+                                             source_titles, target_titles, element_tuples, element_parameters,
+                                             compute_workers, snapshot)
+        finally:
+            # also when the deadline stops the run: the snapshot holds the elements read so far
+            if snapshot:
+                snapshot.close()
+                logging.info(f"Saved snapshot of {len(snapshot.lengths)} elements to '{snapshot_out}'")
+
+            if tidy in ("True", "true", "TRUE", "1", 1):
+                if view_source:
+                    tm1_source.views.delete(view_source.cube, view_source.name, private=False)
+                tm1_target.views.delete(view_target.cube, view_target.name, private=False)
+        if checkpoint:
+            checkpoint.remove()
+        return {**completed, **results}
+
+    def execute_batch(self, method, parameters, tm1_source, tm1_target, view_source, view_target, source_titles,
+                      target_titles, element_tuples, element_parameters, compute_workers, snapshot=None):
+        series, dates, target_mdx = [], [], []
+        with phase(self.stats, "read"):
+            for element_tuple in element_tuples:
+                element_values, element_dates = [], []
+                # scalar methods (e.g. FV, PMT) work without source view
+                if view_source:
+                    mdx = self.substitute_view_titles(view_source, source_titles, element_tuple)
+                    rows_and_values = read_rows_and_values(tm1_source, parameters["tm1_source"], view_source.cube,
+                                                           mdx, parameters.get("cache_dir"))
+                    element_values, element_dates = rows_and_values_to_series(rows_and_values)
+                series.append(element_values)
+                dates.append(element_dates)
+                target_mdx.append(self.substitute_view_titles(view_target, target_titles, element_tuple))
+        if snapshot:
+            snapshot.append(series, dates)
+
+        with phase(self.stats, "compute"):
+            results = compute_batch(method, parameters, series, dates, compute_workers, element_parameters)
+
+        tolerance = write_tolerance(parameters)
+        with phase(self.stats, "write"):
+            if tolerance is not None:
+                # current target values of all elements are read with one request
+                suppressed = self.write_chunk(tm1_target, view_target, target_titles, element_tuples, results,
+                                              self.cells_per_element(tm1_target, view_target, target_titles,
+                                                                     element_tuples),
+                                              tolerance)
+                logging.info(f"Suppressed {suppressed} unchanged writes")
+            else:
+                for mdx, result in zip(target_mdx, results):
+                    tm1_target.cells.write_values_through_cellset(mdx=mdx, values=cell_values(result))
+
+        log_results(method, element_tuples, results)
+        logging.info(f"Calculated {method} for {len(element_tuples)} elements")
+        return dict(zip(element_tuples, results))
+
+    def execute_pipeline(self, method, parameters, tm1_source, tm1_target, view_source, view_target, source_titles,
+                         target_titles, element_tuples, element_parameters, compute_workers, chunk_sizer,
+                         snapshot=None, checkpoint: Checkpoint = None):
+        """ Process the elements in chunks with three overlapping stages:
+        chunk k+1 is read while chunk k is computed and chunk k-1 is written.
+        Stages are connected through bounded queues, so memory stays limited to a few chunks.
+        With a deadline no further chunk is read once it would not finish in time. Chunks already read are still
+        computed and written
+        """
+        computations = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        writes = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        failed = threading.Event()
+        errors = []
+
+        cells_per_element = self.cells_per_element(tm1_target, view_target, target_titles, element_tuples)
+        tolerance = write_tolerance(parameters)
+        suppressed = 0
+        results_by_element = dict()
+        # the stages run in their own threads
+        stats = self.stats
+        stopped = False
+
+        def read():
+            nonlocal stopped
+            start = 0
+            while start < len(element_tuples):
+                if checkpoint and checkpoint.expired(chunk_sizer.size):
+                    stopped = True
+                    break
+                stop = min(start + chunk_sizer.size, len(element_tuples))
+                started = time.perf_counter()
+                with phase(stats, "read"):
+                    series, dates = self.read_chunk(tm1_source, view_source, source_titles,
+                                                    element_tuples[start:stop], parameters.get("tm1_source"),
+                                                    parameters.get("cache_dir"))
+                chunk_sizer.observe(stop - start, time.perf_counter() - started, sum(map(len, series)))
+                if snapshot:
+                    snapshot.append(series, dates)
+                if not _put(computations, (start, stop, series, dates), failed):
+                    return
+                start = stop
+            _put(computations, None, failed)
+
+        def compute(executor):
+            while True:
+                chunk = _get(computations, failed)
+                if chunk is None:
+                    _put(writes, None, failed)
+                    return
+                start, stop, series, dates = chunk
+                with phase(stats, "compute"):
+                    results = compute_batch(
+                        method, parameters, series, dates, compute_workers,
+                        {name: values[start:stop] for name, values in element_parameters.items()},
+                        executor)
+                if not _put(writes, (start, stop, results), failed):
+                    return
+
+        def write():
+            nonlocal suppressed
+            while True:
+                chunk = _get(writes, failed)
+                if chunk is None:
+                    return
+                start, stop, results = chunk
+                with phase(stats, "write"):
+                    suppressed += self.write_chunk(tm1_target, view_target, target_titles,
+                                                   element_tuples[start:stop], results, cells_per_element, tolerance)
+                log_results(method, element_tuples[start:stop], results)
+                results_by_element.update(zip(element_tuples[start:stop], results))
+                if checkpoint:
+                    checkpoint.add(element_tuples[start:stop], results)
+
+        def run_stage(stage, *args):
+            try:
+                stage(*args)
+            except Exception as ex:
+                errors.append(ex)
+                failed.set()
+
+        stages = [threading.Thread(target=run_stage, args=(stage,), daemon=True) for stage in (read, write)]
+        for stage in stages:
+            stage.start()
+        executor = process_pool(compute_workers) if compute_workers > 1 else None
+        try:
+            run_stage(compute, executor)
+        finally:
+            for stage in stages:
+                stage.join()
+            if executor:
+                executor.shutdown()
+            if checkpoint:
+                checkpoint.save()
+        if errors:
+            raise errors[0]
+        if stopped:
+            pending = len(element_tuples) - len(results_by_element)
+            raise DeadlineReached(
+                f"Deadline reached with {pending} elements pending. Rerun with --resume true to continue from "
+                f"checkpoint '{checkpoint.path}'")
+        if tolerance is not None:
+            logging.info(f"Suppressed {suppressed} unchanged writes")
+        logging.info(f"Calculated {method} for {len(element_tuples)} elements")
+        return results_by_element
+
+    def cells_per_element(self, tm1, view, titles, element_tuples):
+        """ cells of one element in the target view or None if chunks can not be written with one request """
+        if element_tuples and self.supports_chunk_write(view):
+            return tm1.cells.execute_mdx_cellcount(self.chunk_mdx(view, titles, element_tuples[:1]))
+        return None
+
+    @staticmethod
+    def supports_chunk_write(view) -> bool:
+        """ chunks are written with one request, if every element has the same cells in the target view """
+        return isinstance(view, NativeView) and not view.suppress_empty_rows and not view.suppress_empty_columns
+
+    def chunk_mdx(self, view, titles, element_tuples) -> str:
+        """ MDX for a native view with the element tuples of the chunk cross joined on the rows """
+        query = MdxBuilder.from_cube(view.cube)
+        if view.suppress_empty_rows:
+            query.rows_non_empty()
+        title_set = MdxHierarchySet.tuples([
+            MdxTuple.of(*[Member.of(dimension, hierarchy, element)
+                          for (dimension, hierarchy), element
+                          in zip(titles, element_tuple)])
+            for element_tuple
+            in element_tuples])
+        query.add_set_to_row_axis(MdxHierarchySet.cross_joins(
+            [title_set] + [self.axis_selection_to_set(axis_selection) for axis_selection in view.rows]))
+        for axis_selection in view.columns:
+            query.add_hierarchy_set_to_column_axis(self.axis_selection_to_set(axis_selection))
+        for title in view.titles:
+            if not any(case_and_space_insensitive_equals(title.dimension_name, dimension) for dimension, _ in titles):
+                query.add_member_to_where(Member.of(title.dimension_name, title.selected))
+        return query.to_mdx()
+
+    def read_chunk(self, tm1, view, titles, element_tuples, instance=None, cache_dir=None):
+        """ Series and dates for every element tuple of the chunk.
+        Native views are read with one request for the chunk, MDX views with one request per element tuple
+
+        :param instance: name of the source instance. Part of the cache key
+        :param cache_dir: directory of the read cache. None reads without cache
+        """
+        if view is None:
+            return [[] for _ in element_tuples], [[] for _ in element_tuples]
+
+        if isinstance(view, NativeView) and not view.suppress_empty_columns:
+            rows_and_values = read_rows_and_values(
+                tm1, instance, view.cube, self.chunk_mdx(view, titles, element_tuples), cache_dir)
+            rows_by_element = CaseAndSpaceInsensitiveTuplesDict()
+            for row, values in rows_and_values.items():
+                element_tuple = tuple(row[:len(titles)])
+                if element_tuple not in rows_by_element:
+                    rows_by_element[element_tuple] = dict()
+                rows_by_element[element_tuple][tuple(row[len(titles):])] = values
+            series = [rows_and_values_to_series(rows_by_element[element_tuple])
+                      if element_tuple in rows_by_element
+                      else ([], [])
+                      for element_tuple
+                      in element_tuples]
+        else:
+            series = [rows_and_values_to_series(read_rows_and_values(
+                tm1, instance, view.cube, self.substitute_view_titles(view, titles, element_tuple), cache_dir))
+                for element_tuple
+                in element_tuples]
+        return [values for values, _ in series], [dates for _, dates in series]
+
+    def write_chunk(self, tm1, view, titles, element_tuples, results, cells_per_element, tolerance=None):
+        """ Write the results of a chunk with one request, if every result fills the cells of its element
+
+        :param tolerance: only write cells that differ from the current value by more than tolerance. None writes all
+        :return: number of suppressed writes
+        """
+        values = [cell_values(result) for result in results]
+        if cells_per_element is not None and all(len(element_values) == cells_per_element
+                                                 for element_values
+                                                 in values):
+            return write_cell_values(
+                tm1, view.cube, self.chunk_mdx(view, titles, element_tuples),
+                list(itertools.chain.from_iterable(values)), tolerance)
+
+        return sum(write_cell_values(
+            tm1, view.cube, self.substitute_view_titles(view, titles, element_tuple), element_values, tolerance)
+            for element_tuple, element_values
+            in zip(element_tuples, values))
+
+    def resolve_title(self, tm1, view, dimension, hierarchy):
+        """ MDX views need the actual dimension and hierarchy names for the title substitution """
+        if not isinstance(view, MDXView):
+            return dimension, hierarchy
+        key = (id(tm1), dimension, hierarchy)
+        if key not in self.actual_names:
+            self.actual_names[key] = (
+                tm1.dimensions.determine_actual_object_name("Dimension", dimension),
+                tm1.hierarchies.determine_actual_object_name("Hierarchy", hierarchy))
+        return self.actual_names[key]
+
+    def substitute_view_title(self, view, dimension, hierarchy, element) -> str:
+        """ Substitute the title element on the (local) view object
+
+        :return: MDX of the altered view
+        """
+        if isinstance(view, MDXView):
+            self.substitute_mdx_view_title(view, dimension, hierarchy, element)
+        else:
+            self.substitute_native_view_title(view, dimension, element)
+        return view.MDX
+
+    def substitute_view_titles(self, view, titles, element_tuple) -> str:
+        """ Substitute one title element per (dimension, hierarchy) pair in titles
+
+        :return: MDX of the altered view
+        """
+        for (dimension, hierarchy), element in zip(titles, element_tuple):
+            self.substitute_view_title(view, dimension, hierarchy, element)
+        return view.MDX
 
     def substitute_mdx_view_title(self, view, dimension, hierarchy, element):
         pattern = re.compile(r"\[" + dimension + r"\].\[" + hierarchy + r"\].\[(.*?)\]", re.IGNORECASE)
@@ -183,16 +842,303 @@ class CubeCalc:
                 [view_source, view_target]):
             tm1 = self.tm1_services[tm1_instance_name]
             view = tm1.views.get(cube_name, view_name, private=False)
+            dimension, hierarchy = self.resolve_title(tm1, view, dimension, hierarchy)
+            self.substitute_view_title(view, dimension, hierarchy, element)
+            tm1.views.update(view, private=False)
+
+
+def compute_batch(method: str, parameters: Dict, series: List[List], dates: List[List],
+                  compute_workers: int = 1, element_parameters: Dict[str, List] = None,
+                  executor: ProcessPoolExecutor = None) -> List:
+    """ Calculate method for every series.
+
+    With more than one worker the calculation is sent to a process pool in chunks. Values and dates are shared
+    with the workers through shared memory buffers instead of being pickled per call.
+
+    :param method: name of the method as in METHODS
+    :param parameters: scalar parameters, identical for every series
+    :param series: list of value lists or arrays. Empty cells (None) are passed to the method as NaN
+    :param dates: list of date lists or ordinal arrays (one per series, empty for methods without dates)
+    :param compute_workers: number of processes
+    :param element_parameters: parameters with one value per series
+    :param executor: process pool to reuse across calls. By default a pool is created for the call
+    :return: list of results in the order of series
+    """
+    element_parameters = element_parameters or dict()
+    # empty cells are NaN on every path. Arrays (e.g. views on a snapshot) are not copied
+    series = [np.asarray(element_values, dtype=np.float64) for element_values in series]
+    if element_parameters and method in VECTORIZED_METHODS:
+        # one call with arrays for all series
+        result = METHODS[method](**{
+            **parameters,
+            **{name: np.asarray(values, dtype=np.float64) for name, values in element_parameters.items()}})
+        return np.broadcast_to(result, (len(series),)).tolist()
+
+    if (not element_parameters
+            and method in ROW_WISE_METHODS
+            and series
+            and len({len(element_values) for element_values in series}) == 1):
+        # one call for all series of equal length
+        results = ROW_WISE_METHODS[method](np.asarray(series, dtype=np.float64), **parameters)
+        return [result.tolist() if isinstance(result, np.ndarray) else float(result) for result in results]
+
+    if compute_workers <= 1 or len(series) <= 1:
+        return [METHODS[method](
+            **{**parameters, **{name: values[i] for name, values in element_parameters.items()}},
+            values=element_values,
+            dates=element_dates)
+            for i, (element_values, element_dates)
+            in enumerate(zip(series, dates))]
+
+    values = np.concatenate(series)
+    ordinals = np.concatenate([date_ordinals(element_dates) for element_dates in dates])
+    offsets = np.zeros(len(series) + 1, dtype=np.int64)
+    np.cumsum([len(element_values) for element_values in series], out=offsets[1:])
+    # methods without dates get no dates
+    date_offsets = np.zeros(len(dates) + 1, dtype=np.int64)
+    np.cumsum([len(element_dates) for element_dates in dates], out=date_offsets[1:])
+
+    buffers = [_to_shared_memory(array) for array in (offsets, values, date_offsets, ordinals)]
+    try:
+        descriptors = [descriptor for _, descriptor in buffers]
+        chunk_size = max(1, -(-len(series) // (compute_workers * 4)))
+        pool = executor or process_pool(compute_workers)
+        try:
+            futures = [
+                pool.submit(_compute_chunk, method, parameters, descriptors, start,
+                            min(start + chunk_size, len(series)),
+                            {name: values[start:start + chunk_size] for name, values in element_parameters.items()})
+                for start
+                in range(0, len(series), chunk_size)]
+            return [result for future in futures for result in future.result()]
+        finally:
+            if executor is None:
+                pool.shutdown()
+    finally:
+        for shm, _ in buffers:
+            shm.close()
+            shm.unlink()
 
-            if isinstance(view, MDXView):
-                dimension = tm1.dimensions.determine_actual_object_name("Dimension", dimension)
-                hierarchy = tm1.hierarchies.determine_actual_object_name("Hierarchy", hierarchy)
-                self.substitute_mdx_view_title(view, dimension, hierarchy, element)
 
+def replay_snapshot(directory, parameters: Dict) -> bool:
+    """ Compute the method of a snapshot offline. Values are read from memory-mapped files, nothing is written
+
+    :param directory: directory written with snapshot_out
+    :param parameters: parameters overriding the parameters of the snapshot, e.g. compute_workers
+    :return: success
+    """
+    try:
+        snapshot = Snapshot(directory)
+        parameters = dict(parameters)
+        compute_workers = int(parameters.pop("compute_workers", 1))
+        parameters = {**snapshot.parameters, **parameters}
+        series, dates = snapshot.series(), snapshot.dates()
+
+        started = time.perf_counter()
+        results = compute_batch(snapshot.method, parameters, series, dates, compute_workers,
+                                snapshot.element_parameters)
+        seconds = time.perf_counter() - started
+
+        log_results(snapshot.method, snapshot.element_tuples, results)
+        logging.info(f"Computed {snapshot.method} for {len(results)} elements ({len(snapshot.values)} cells) "
+                     f"from snapshot '{directory}' in {seconds:.3f} s")
+        return True
+    except Exception as ex:
+        logging.exception(f"Failed replaying snapshot '{directory}'. Error: {str(ex)}")
+        return False
+
+
+class ChunkSizer:
+    """ Number of elements per chunk in the pipelined mode.
+    'auto' adapts the size to the latency and payload of the previous read
+    """
+
+    def __init__(self, chunk_size):
+        self.auto = str(chunk_size).lower() == "auto"
+        self.size = CHUNK_INITIAL_SIZE if self.auto else int(chunk_size)
+        if self.size < 1:
+            raise ValueError(f"'chunk_size' must be a positive number or 'auto'. Got: '{chunk_size}'")
+
+    def observe(self, elements: int, seconds: float, cells: int):
+        """ adapt the size after a read of elements that took seconds and returned cells """
+        if not self.auto or elements == 0:
+            return
+        # grow at most by factor 2 per chunk, shrink immediately
+        limits = [2 * self.size]
+        if seconds > 0:
+            limits.append(elements * CHUNK_TARGET_SECONDS / seconds)
+        if cells > 0:
+            limits.append(elements * CHUNK_MAX_CELLS / cells)
+        self.size = max(1, int(min(limits)))
+
+
+def _put(pipeline_queue: queue.Queue, item, failed: threading.Event) -> bool:
+    """ put item on a bounded queue unless another stage failed """
+    while not failed.is_set():
+        try:
+            pipeline_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(pipeline_queue: queue.Queue, failed: threading.Event):
+    """ next item from the queue. None marks the end or the failure of another stage """
+    while not failed.is_set():
+        try:
+            return pipeline_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def read_bound_parameters(tm1: TM1Service, dimensions: List[str], hierarchies: List[str],
+                          element_tuples: List[Tuple[str, ...]], bindings: Dict[str, str]) -> Dict[str, List]:
+    """ Read parameters bound to a parameter cube for all element tuples with one MDX query per cube
+
+    :param bindings: parameter name and binding '<cube>:<element>,<element>'. The binding lists one element for
+    every dimension of the cube that is not a title dimension, in the order of the cube dimensions. Cubes without a
+    title dimension hold one value for all element tuples
+    :return: parameter name and values in the order of element_tuples
+    """
+    bindings_by_cube = dict()
+    for name, binding in bindings.items():
+        cube, _, coordinates = binding.partition(":")
+        if not coordinates:
+            raise ValueError(f"Binding for '{name}' must look like '<cube>:<element>,<element>'. Got: '{binding}'")
+        bindings_by_cube.setdefault(cube, []).append((name, coordinates.split(",")))
+
+    element_parameters = dict()
+    for cube, cube_bindings in bindings_by_cube.items():
+        cube_dimensions = tm1.cubes.get_dimension_names(cube)
+        # title dimensions that are part of the parameter cube go on the rows
+        title_positions = [position
+                           for position, dimension
+                           in enumerate(dimensions)
+                           if any(case_and_space_insensitive_equals(dimension, cube_dimension)
+                                  for cube_dimension
+                                  in cube_dimensions)]
+        other_dimensions = [cube_dimension
+                            for cube_dimension
+                            in cube_dimensions
+                            if not any(case_and_space_insensitive_equals(dimension, cube_dimension)
+                                       for dimension
+                                       in dimensions)]
+
+        for name, coordinates in cube_bindings:
+            if len(coordinates) != len(other_dimensions):
+                raise ValueError(f"Binding for '{name}' needs one element for each of {other_dimensions}")
+        if not title_positions:
+            # no title dimension in the parameter cube: one value for all element tuples
+            for name, coordinates in cube_bindings:
+                value = tm1.cells.get_value(cube, ",".join(coordinates)) or 0
+                element_parameters[name] = [value] * len(element_tuples)
+            continue
+
+        query = MdxBuilder.from_cube(cube)
+        rows = list(dict.fromkeys(tuple(element_tuple[position] for position in title_positions)
+                                  for element_tuple
+                                  in element_tuples))
+        for row in rows:
+            query.add_member_tuple_to_rows(*[
+                Member.of(dimensions[position], hierarchies[position], element)
+                for position, element
+                in zip(title_positions, row)])
+        for name, coordinates in cube_bindings:
+            query.add_member_tuple_to_columns(*[
+                Member.of(dimension, element)
+                for dimension, element
+                in zip(other_dimensions, coordinates)])
+
+        rows_and_values = tm1.cells.execute_mdx_rows_and_values(mdx=query.to_mdx(), element_unique_names=False)
+        for column, (name, _) in enumerate(cube_bindings):
+            element_parameters[name] = [
+                rows_and_values[tuple(element_tuple[position] for position in title_positions)][column] or 0
+                for element_tuple
+                in element_tuples]
+    return element_parameters
+
+
+def aggregation_matrix(edges: Dict[Tuple[str, str], float], nodes: List[str]):
+    """ Sparse matrix with one row per node and one column per leaf, holding the weight of every leaf in the node.
+    Weights along a path are multiplied, e.g. a leaf with weight -1 below a consolidation with weight 0.5 counts -0.5
+
+    :param edges: parent and child: weight, as in Hierarchy.edges
+    :param nodes: leaves and consolidations
+    :return: csr matrix (nodes x leaves), leaf names in the order of the columns
+    """
+    children = dict()
+    for (parent, child), weight in edges.items():
+        children.setdefault(_element_key(parent), []).append((child, weight))
+
+    leaf_weights = dict()
+
+    def weights(element):
+        key = _element_key(element)
+        if key not in leaf_weights:
+            if key not in children:
+                leaf_weights[key] = {key: (element, 1.0)}
             else:
-                self.substitute_native_view_title(view, dimension, element)
+                combined = dict()
+                for child, weight in children[key]:
+                    for leaf_key, (leaf, leaf_weight) in weights(child).items():
+                        combined[leaf_key] = (leaf, combined.get(leaf_key, (leaf, 0.0))[1] + weight * leaf_weight)
+                leaf_weights[key] = combined
+        return leaf_weights[key]
 
-            tm1.views.update(view, private=False)
+    node_weights = [weights(node) for node in nodes]
+    columns = dict()
+    for node_weight in node_weights:
+        for leaf_key, (leaf, _) in node_weight.items():
+            columns.setdefault(leaf_key, (len(columns), leaf))
+
+    rows, cols, data = [], [], []
+    for row, node_weight in enumerate(node_weights):
+        for leaf_key, (_, weight) in node_weight.items():
+            rows.append(row)
+            cols.append(columns[leaf_key][0])
+            data.append(weight)
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(nodes), len(columns)), dtype=np.float64)
+    return matrix, [leaf for _, leaf in columns.values()]
+
+
+def _element_key(element: str) -> str:
+    """ TM1 element names are case and space insensitive """
+    return element.lower().replace(" ", "")
+
+
+def _to_shared_memory(array: np.ndarray):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach_shared_memory(descriptor):
+    name, shape, dtype = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _compute_chunk(method, parameters, descriptors, start, stop, element_parameters):
+    """ Runs in a worker process: calculate method for series start to stop from the shared buffers """
+    shms, arrays = zip(*(_attach_shared_memory(descriptor) for descriptor in descriptors))
+    try:
+        offsets, values, date_offsets, ordinals = arrays
+        results = []
+        for i in range(start, stop):
+            result = METHODS[method](
+                **{**parameters, **{name: chunk_values[i - start] for name, chunk_values in element_parameters.items()}},
+                values=values[offsets[i]:offsets[i + 1]],
+                dates=ordinals[date_offsets[i]:date_offsets[i + 1]])
+            # results must not be views on the buffers
+            results.append(np.array(result) if isinstance(result, np.ndarray) else result)
+        return results
+    finally:
+        # views on the buffers must be released before the buffers can be closed
+        arrays = offsets = values = date_offsets = ordinals = None
+        for shm in shms:
+            shm.close()
 
 
 def exit_cubecalc(success, elapsed_time):